@@ -2,6 +2,7 @@
 from discord.ui import View, Button, Modal, TextInput
 from discord import ButtonStyle, Interaction
 import db
+import instrumentation
 
 class BankView(View):
     def __init__(self, bot):
@@ -16,6 +17,7 @@ class RegisterButton(Button):
         super().__init__(label="📝 Register", style=ButtonStyle.primary, custom_id="register_scum")
         self.bot = bot
 
+    @instrumentation.interaction("bank_register")
     async def callback(self, interaction: Interaction):
         await interaction.response.send_modal(RegisterModal(self.bot, interaction.user.id, interaction.user.name))
 
@@ -24,6 +26,7 @@ class BalanceButton(Button):
         super().__init__(label="💰 Check Balance", style=ButtonStyle.green, custom_id="check_balance")
         self.bot = bot
 
+    @instrumentation.interaction("bank_balance")
     async def callback(self, interaction: Interaction):
         balance = db.get_balance_by_discord_id(interaction.user.id)
         await interaction.response.send_message(f"🪙 Your balance: **{int(balance)} coins**", ephemeral=True)
@@ -37,7 +40,9 @@ class TransferModal(Modal, title="Transfer Coins"):
         self.add_item(TextInput(label="Recipient Discord ID", placeholder="e.g. 123456789012345678"))
         self.add_item(TextInput(label="Amount to transfer", placeholder="e.g. 50"))
 
+    @instrumentation.interaction("bank_transfer_submit")
     async def on_submit(self, interaction: Interaction):
+        cog = interaction.client.get_cog("ScumBot")
         try:
             recipient_id = int(self.children[0].value.strip())
             amount = int(self.children[1].value.strip())
@@ -50,6 +55,8 @@ class TransferModal(Modal, title="Transfer Coins"):
             if amount <= 0 or sender_balance < amount:
                 await interaction.response.send_message("❌ Invalid amount or insufficient balance.", ephemeral=True)
                 return
+            if cog and not await cog.check_rate_limit(interaction, "transfer"):
+                return
 
             db.update_balance_by_discord_id(self.sender_id, -amount)
             db.update_balance_by_discord_id(recipient_id, amount)
@@ -66,6 +73,7 @@ class TransferButton(Button):
         super().__init__(label="💸 Transfer Coins", style=ButtonStyle.blurple, custom_id="transfer_coin")
         self.bot = bot
 
+    @instrumentation.interaction("bank_transfer")
     async def callback(self, interaction: Interaction):
         await interaction.response.send_modal(TransferModal(self.bot, interaction.user.id))
 
@@ -74,6 +82,7 @@ class PurchaseHistoryButton(Button):
         super().__init__(label="📜 Purchase History", style=ButtonStyle.secondary, custom_id="purchase_history")
         self.bot = bot
 
+    @instrumentation.interaction("bank_history")
     async def callback(self, interaction: Interaction):
         orders = db.get_order_history_by_discord_id(interaction.user.id)
 
@@ -106,6 +115,7 @@ class RegisterModal(Modal, title="Register Your SCUM Name"):
 
         self.add_item(TextInput(label="SCUM In-Game Name", placeholder="e.g. MadMax123", required=True))
 
+    @instrumentation.interaction("bank_register_submit")
     async def on_submit(self, interaction: Interaction):
         scum_name = self.children[0].value.strip()
         db.get_or_create_player(self.user_id, scum_name, self.username)
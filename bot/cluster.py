@@ -0,0 +1,107 @@
+# cluster.py – shard layout and cross-process job forwarding for sharded deployments
+#
+# With SHARD_COUNT unset the bot runs as one unsharded process, exactly as before. With
+# SHARD_COUNT=N every process runs an AutoShardedBot over its SHARD_IDS slice. Discord
+# delivers each guild's events to one shard, so exactly one process "owns" DISCORD_GUILD_ID:
+# it syncs commands, posts status/shop/taxi messages and runs internal API jobs. Any other
+# process accepting an API call forwards it through Postgres NOTIFY to that owner.
+
+import os
+import json
+import asyncio
+
+import db
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT") or 0)  # blank/0 = single unsharded process
+API_CHANNEL = "scumbot_api"                       # NOTIFY channel for forwarded API jobs
+RECONNECT_DELAY = 5
+
+
+def parse_shard_ids(spec):
+    """Parse SHARD_IDS like "0-3" or "0,2,5" into a sorted list; empty means every shard (None)."""
+    ids = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(part))
+    return sorted(set(ids)) or None
+
+
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+
+
+def shard_for_guild(guild_id, shard_count=SHARD_COUNT):
+    # Discord's routing formula
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(guild_id):
+    """True when this process receives the gateway events for guild_id."""
+    if not SHARD_COUNT:
+        return True
+    shard_ids = SHARD_IDS if SHARD_IDS is not None else range(SHARD_COUNT)
+    return shard_for_guild(guild_id) in shard_ids
+
+
+def forward(kind, payload):
+    """Hand an API job to the owning process. NOTIFY payloads are capped at 8000 bytes."""
+    db.notify(API_CHANNEL, json.dumps({"kind": kind, "payload": payload}, default=str))
+
+
+class JobListener:
+    """
+    LISTENs on `channels` (API_CHANNEL by default) over a dedicated autocommit connection whose
+    socket is watched by the event loop, so forwarded jobs run on the loop without polling or
+    extra threads. Every notification is JSON {"kind": ..., "payload": ...}.
+    """
+
+    def __init__(self, handler, channels=(API_CHANNEL,)):
+        self.handler = handler  # async handler(kind, payload)
+        self.channels = tuple(channels)
+        self.conn = None
+        self.loop = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.conn = db.get_connection(pooled=False)  # long-lived LISTEN connection of its own
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            for channel in self.channels:
+                cur.execute(f"LISTEN {channel};")
+        loop.add_reader(self.conn.fileno(), self._on_readable)
+        print(f"📡 Listening on {', '.join(self.channels)}")
+
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except Exception as e:
+            print(f"⚠️ Job listener connection lost: {e}")
+            self.loop.remove_reader(self.conn.fileno())
+            self.loop.create_task(self._reconnect())
+            return
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            try:
+                job = json.loads(notify.payload)
+            except ValueError:
+                print(f"⚠️ Ignoring malformed notification on {notify.channel}: {notify.payload[:200]}")
+                continue
+            self.loop.create_task(self.handler(job["kind"], job.get("payload")))
+
+    async def _reconnect(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        while True:
+            await asyncio.sleep(RECONNECT_DELAY)
+            try:
+                self.start(self.loop)
+                return
+            except Exception as e:
+                print(f"⚠️ Job listener reconnect failed: {e}")
@@ -4,20 +4,165 @@
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import os
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from psycopg2.extras import RealDictCursor
 
 DB_URL = os.getenv("DATABASE_URL")
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX") or 0)  # >0 reuses connections from a per-process pool
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 10)  # seconds to wait for a free pooled connection
+PLAYER_CACHE_TTL = int(os.getenv("PLAYER_CACHE_TTL", "300"))  # seconds; 0 disables the identity cache
+PLAYER_CACHE_SIZE = 5000
+PLAYER_NOTIFY_CHANNEL = "scumbot_players"  # NOTIFY channel telling other processes to drop a cached player
+VERSIONED_TABLES = ("shop_items", "taxis", "leaderboard_snapshots")  # change counters for admin page caching
+LEADERBOARDS = ("wealth", "spenders")
+DB_INIT_ALWAYS = os.getenv("DB_INIT_ALWAYS", "false").lower() == "true"  # rerun init() DDL at the same version
+SCHEMA_VERSION = 3  # bump whenever init() changes the schema (tables, columns, indexes, trigger functions)
+SCHEMA_SETTING = "schema_version"  # settings key holding the version the database was last migrated to
+SCHEMA_LOCK_ID = 7_203_411  # pg_advisory_xact_lock key serializing init() across processes
+# settings key marking the rollups as backfilled; renamed when counting rules change so init() rebuilds them
+ANALYTICS_BACKFILL_SETTING = "analytics_backfilled_v2"  # v2: failed orders excluded
+
+# discord_id -> (player_id, scum_username, discord_username, expires at)
+_player_cache = OrderedDict()
+_player_cache_lock = threading.Lock()
+
+# ─── Connection pool (opt-in) ────────────────────────
+# Pools are keyed by pid: a pool created before a fork (e.g. gunicorn --preload) is never
+# shared with the children, each worker lazily opens its own on first use.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _PooledConnection:
+    """`with get_connection() as conn:` keeps its commit/rollback semantics and returns conn to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._conn.__exit__(exc_type, exc, tb)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            broken = self._conn.closed or self._conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+            if not broken and self._conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                self._conn.rollback()
+            self._pool.putconn(self._conn, close=broken)
+            self._conn = None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _BlockingPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool raises PoolError when exhausted; this one waits for a free connection."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise psycopg2.pool.PoolError(f"no pooled connection free after {DB_POOL_TIMEOUT}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def _get_pool():
+    pid = os.getpid()
+    pool = _pools.get(pid)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(pid)
+            if pool is None:
+                pool = _pools[pid] = _BlockingPool(1, DB_POOL_MAX, DB_URL)
+    return pool
+
+
+def reset_pool():
+    """Close this process's pool (and forget inherited ones); the next query opens a fresh one."""
+    with _pools_lock:
+        pool = _pools.pop(os.getpid(), None)
+        _pools.clear()
+    if pool is not None:
+        pool.closeall()
+
+
+def get_connection(pooled=True):
+    if DB_POOL_MAX > 0 and pooled:
+        pool = _get_pool()
+        return _PooledConnection(pool, pool.getconn())
 
-def get_connection():
     print("Connecting to:", DB_URL)
 
     return psycopg2.connect(DB_URL)
 
-def init():
+
+def ping():
+    """Cheap readiness probe: True when the database answers."""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            return cur.fetchone()[0] == 1
+
+
+def _stored_schema_version(cur):
+    cur.execute("SELECT to_regclass('settings') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT value FROM settings WHERE key = %s", (SCHEMA_SETTING,))
+    row = cur.fetchone()
+    return int(row[0]) if row and row[0] and row[0].isdigit() else 0
+
+
+def init(force=DB_INIT_ALWAYS):
+    """
+    Create/upgrade the schema to SCHEMA_VERSION. The DDL below takes locks and costs seconds,
+    so it only runs when the database is behind (force re-runs it at the same version). A
+    process older than the database never runs its DDL, so a rolling deploy can't put old
+    trigger functions back.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            stored = _stored_schema_version(cur)
+    if stored > SCHEMA_VERSION:
+        print(f"⚠️ Database schema v{stored} is newer than this build (v{SCHEMA_VERSION}), skipping DDL")
+        return
+    if stored == SCHEMA_VERSION and not force:
+        print(f"✅ Database schema v{stored} is current, skipping DDL")
+        return
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # One migrating process at a time; a newer one may have finished while we waited
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            stored = _stored_schema_version(cur)
+            if stored > SCHEMA_VERSION:
+                print(f"⚠️ Database schema v{stored} is newer than this build (v{SCHEMA_VERSION}), skipping DDL")
+                return
+
             # ─── Players table ───────────────────────────────
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS players (
@@ -43,6 +188,22 @@ def init():
             cur.execute("ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS content TEXT;")
             cur.execute("ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS message_id TEXT;")
             cur.execute("ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS channel_id TEXT;")
+            cur.execute("ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS embed_hash TEXT;")
+
+            # ─── Shop item search (full-text + trigram) ──────
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            cur.execute("""
+                ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce(description, '')), 'C') ||
+                    setweight(to_tsvector('simple', coalesce(content, '')), 'D')
+                ) STORED;
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_shop_items_search ON shop_items USING GIN (search_vector);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_shop_items_name_trgm ON shop_items USING GIN (name gin_trgm_ops);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_shop_items_category ON shop_items(category);")
 
             # ─── Orders table ────────────────────────────────
             cur.execute("""
@@ -60,6 +221,24 @@ def init():
                 ALTER TABLE orders
                 ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'pending'
             """)
+            cur.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMP;")
+            # Databases created from older schema.sql named the order time created_at
+            cur.execute("""
+                DO $$
+                BEGIN
+                    IF EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name='orders' AND column_name='created_at'
+                    ) AND NOT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name='orders' AND column_name='timestamp'
+                    ) THEN
+                        ALTER TABLE orders RENAME COLUMN created_at TO "timestamp";
+                    END IF;
+                END$$;
+            """)
+            # The rollup trigger looks up a player's other orders when one fails or is deleted
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_player_id ON orders(player_id);")
 
             # ─── Audit Logs table ────────────────────────────
             cur.execute("""
@@ -103,17 +282,521 @@ def init():
                     completed_at TIMESTAMP
                 );
             """)
+            cur.execute("ALTER TABLE taxi_orders ADD COLUMN IF NOT EXISTS error TEXT;")
 
             # ─── Helpful indexes ─────────────────────────────
             cur.execute("CREATE INDEX IF NOT EXISTS idx_taxi_orders_player_id ON taxi_orders(player_id);")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_taxi_orders_taxi_id ON taxi_orders(taxi_id);")
 
+            # ─── Rate limit buckets (UNLOGGED: fast, not replicated, may be lost on crash) ──
+            cur.execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    tokens DOUBLE PRECISION NOT NULL,
+                    allowed BOOLEAN NOT NULL DEFAULT TRUE,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    expires_at TIMESTAMPTZ NOT NULL
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_expires_at ON rate_limits(expires_at);")
+
+            # ─── Outbox: catalog changes for the bot, written in the same transaction ──
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS bot_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    event TEXT NOT NULL,
+                    item_id INT,
+                    payload JSONB,
+                    idempotency_key TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',  -- pending | processing | done | failed
+                    attempts INT NOT NULL DEFAULT 0,
+                    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    claimed_until TIMESTAMP,
+                    last_error TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    processed_at TIMESTAMP
+                );
+            """)
+            cur.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_bot_outbox_pending_key
+                ON bot_outbox(idempotency_key) WHERE status = 'pending';
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_bot_outbox_due
+                ON bot_outbox(status, available_at) WHERE status IN ('pending', 'processing');
+            """)
+
+            # ─── Leaderboards: ranked top-N snapshots, replaced by refresh_leaderboards() ──
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+                    board TEXT NOT NULL,
+                    rank INT NOT NULL,
+                    player_id INT NOT NULL,
+                    discord_id BIGINT,
+                    name TEXT,
+                    value NUMERIC NOT NULL,
+                    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (board, rank)
+                );
+            """)
+            # Top-N by balance walks this index instead of sorting every player
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_players_balance ON players(balance DESC);")
+
+            # ─── Table versions: bumped once per writing statement, drive admin page caching ──
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    table_name TEXT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+                BEGIN
+                    INSERT INTO table_versions (table_name, version, updated_at)
+                    VALUES (TG_TABLE_NAME, 1, NOW())
+                    ON CONFLICT (table_name) DO UPDATE
+                    SET version = table_versions.version + 1, updated_at = NOW();
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            for table in VERSIONED_TABLES:
+                cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_version ON {table};")
+                cur.execute(f"""
+                    CREATE TRIGGER trg_{table}_version
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+                """)
+            # players used to be counted too; every purchase writes a balance, so its counter row
+            # was a lock every concurrent purchase queued on
+            cur.execute("DROP TRIGGER IF EXISTS trg_players_version ON players;")
+
+            # ─── Shared bot state (survives restarts, visible to every shard) ──
+            # settings itself is created further up; older databases lack updated_at
+            cur.execute("ALTER TABLE settings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;")
+
+            # ─── Sales analytics rollups (trigger-maintained, backfilled once) ──
+            # Failed and deleted orders don't count. Daily totals are summed from sales_daily_item
+            # on read: the old one-row-per-day sales_daily was updated by every purchase of the day.
+            cur.execute("""
+                DROP TABLE IF EXISTS sales_daily;
+                CREATE TABLE IF NOT EXISTS sales_daily_item (
+                    day DATE NOT NULL,
+                    item_id INT NOT NULL,
+                    item_name TEXT,
+                    category TEXT,
+                    orders INT NOT NULL DEFAULT 0,
+                    quantity INT NOT NULL DEFAULT 0,
+                    revenue NUMERIC NOT NULL DEFAULT 0,
+                    unique_buyers INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, item_id)
+                );
+                CREATE TABLE IF NOT EXISTS taxi_daily (
+                    day DATE NOT NULL,
+                    taxi_id INT NOT NULL,
+                    taxi_name TEXT,
+                    rides INT NOT NULL DEFAULT 0,
+                    revenue NUMERIC NOT NULL DEFAULT 0,
+                    unique_riders INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, taxi_id)
+                );
+                -- Who already counted towards a day's unique buyers/riders
+                CREATE TABLE IF NOT EXISTS sales_daily_buyers (day DATE, player_id INT, PRIMARY KEY (day, player_id));
+                CREATE TABLE IF NOT EXISTS sales_daily_item_buyers (day DATE, item_id INT, player_id INT, PRIMARY KEY (day, item_id, player_id));
+                CREATE TABLE IF NOT EXISTS taxi_daily_riders (day DATE, taxi_id INT, player_id INT, PRIMARY KEY (day, taxi_id, player_id));
+                -- Lifetime spend per player, ranks the "top spenders" leaderboard
+                CREATE TABLE IF NOT EXISTS player_spend (
+                    player_id INT PRIMARY KEY REFERENCES players(id) ON DELETE CASCADE,
+                    orders INT NOT NULL DEFAULT 0,
+                    rides INT NOT NULL DEFAULT 0,
+                    spent NUMERIC NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_player_spend_spent ON player_spend(spent DESC);
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION rollup_order() RETURNS TRIGGER AS $$
+                DECLARE
+                    o RECORD;
+                    adding BOOLEAN;
+                    d DATE;
+                    buyer_delta INT := 0;
+                BEGIN
+                    -- Failed orders don't count: an insert or a status change out of 'failed' adds the order,
+                    -- a delete or a status change to 'failed' takes it back out
+                    IF TG_OP <> 'DELETE' AND NEW.status IS DISTINCT FROM 'failed'
+                       AND (TG_OP = 'INSERT' OR OLD.status = 'failed') THEN
+                        o := NEW;
+                        adding := TRUE;
+                    ELSIF TG_OP <> 'INSERT' AND OLD.status IS DISTINCT FROM 'failed'
+                       AND (TG_OP = 'DELETE' OR NEW.status = 'failed') THEN
+                        o := OLD;
+                        adding := FALSE;
+                    ELSE
+                        RETURN NULL;
+                    END IF;
+                    d := COALESCE(o.timestamp, NOW())::date;
+
+                    IF adding THEN
+                        INSERT INTO sales_daily_buyers VALUES (d, o.player_id) ON CONFLICT DO NOTHING;
+                        INSERT INTO sales_daily_item_buyers VALUES (d, o.item_id, o.player_id) ON CONFLICT DO NOTHING;
+                        IF FOUND THEN buyer_delta := 1; END IF;
+
+                        INSERT INTO sales_daily_item (day, item_id, item_name, category, orders, quantity, revenue, unique_buyers)
+                        SELECT d, o.item_id, si.name, COALESCE(si.category, 'Misc'), 1, o.quantity, COALESCE(o.total_price, 0), buyer_delta
+                        FROM (SELECT 1) AS one LEFT JOIN shop_items si ON si.id = o.item_id
+                        ON CONFLICT (day, item_id) DO UPDATE SET
+                            item_name = COALESCE(EXCLUDED.item_name, sales_daily_item.item_name),
+                            category = COALESCE(EXCLUDED.category, sales_daily_item.category),
+                            orders = sales_daily_item.orders + 1,
+                            quantity = sales_daily_item.quantity + EXCLUDED.quantity,
+                            revenue = sales_daily_item.revenue + EXCLUDED.revenue,
+                            unique_buyers = sales_daily_item.unique_buyers + EXCLUDED.unique_buyers;
+
+                        INSERT INTO player_spend (player_id, orders, spent)
+                        VALUES (o.player_id, 1, COALESCE(o.total_price, 0))
+                        ON CONFLICT (player_id) DO UPDATE SET
+                            orders = player_spend.orders + 1,
+                            spent = player_spend.spent + EXCLUDED.spent;
+                    ELSE
+                        -- A buyer stops counting for the day once none of their other orders that day count.
+                        -- Only UPDATEs here: a player delete cascades to player_spend and orders alike.
+                        IF NOT EXISTS (
+                            SELECT 1 FROM orders
+                            WHERE player_id = o.player_id AND id <> o.id AND status IS DISTINCT FROM 'failed'
+                              AND COALESCE(timestamp, NOW())::date = d
+                        ) THEN
+                            DELETE FROM sales_daily_buyers WHERE day = d AND player_id = o.player_id;
+                        END IF;
+                        IF NOT EXISTS (
+                            SELECT 1 FROM orders
+                            WHERE player_id = o.player_id AND item_id = o.item_id AND id <> o.id
+                              AND status IS DISTINCT FROM 'failed' AND COALESCE(timestamp, NOW())::date = d
+                        ) THEN
+                            DELETE FROM sales_daily_item_buyers WHERE day = d AND item_id = o.item_id AND player_id = o.player_id;
+                            IF FOUND THEN buyer_delta := 1; END IF;
+                        END IF;
+
+                        UPDATE sales_daily_item SET
+                            orders = orders - 1,
+                            quantity = quantity - o.quantity,
+                            revenue = revenue - COALESCE(o.total_price, 0),
+                            unique_buyers = unique_buyers - buyer_delta
+                        WHERE day = d AND item_id = o.item_id;
+
+                        UPDATE player_spend SET
+                            orders = orders - 1,
+                            spent = spent - COALESCE(o.total_price, 0)
+                        WHERE player_id = o.player_id;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION rollup_taxi_order() RETURNS TRIGGER AS $$
+                DECLARE
+                    o RECORD;
+                    adding BOOLEAN;
+                    d DATE;
+                    ride_price NUMERIC;
+                    rider_delta INT := 0;
+                BEGIN
+                    -- Same rules as rollup_order(): failed rides don't count, deletes take a ride back out
+                    IF TG_OP <> 'DELETE' AND NEW.status IS DISTINCT FROM 'failed'
+                       AND (TG_OP = 'INSERT' OR OLD.status = 'failed') THEN
+                        o := NEW;
+                        adding := TRUE;
+                    ELSIF TG_OP <> 'INSERT' AND OLD.status IS DISTINCT FROM 'failed'
+                       AND (TG_OP = 'DELETE' OR NEW.status = 'failed') THEN
+                        o := OLD;
+                        adding := FALSE;
+                    ELSE
+                        RETURN NULL;
+                    END IF;
+                    d := COALESCE(o.created_at, NOW())::date;
+                    -- Rides carry no price of their own; like the backfill, use the taxi's current price
+                    SELECT COALESCE(MAX(t.price), 0) INTO ride_price FROM taxis t WHERE t.id = o.taxi_id;
+
+                    IF adding THEN
+                        INSERT INTO taxi_daily_riders VALUES (d, o.taxi_id, o.player_id) ON CONFLICT DO NOTHING;
+                        IF FOUND THEN rider_delta := 1; END IF;
+
+                        INSERT INTO taxi_daily (day, taxi_id, taxi_name, rides, revenue, unique_riders)
+                        SELECT d, o.taxi_id, t.name, 1, ride_price, rider_delta
+                        FROM (SELECT 1) AS one LEFT JOIN taxis t ON t.id = o.taxi_id
+                        ON CONFLICT (day, taxi_id) DO UPDATE SET
+                            taxi_name = COALESCE(EXCLUDED.taxi_name, taxi_daily.taxi_name),
+                            rides = taxi_daily.rides + 1,
+                            revenue = taxi_daily.revenue + EXCLUDED.revenue,
+                            unique_riders = taxi_daily.unique_riders + EXCLUDED.unique_riders;
+
+                        INSERT INTO player_spend (player_id, rides, spent)
+                        VALUES (o.player_id, 1, ride_price)
+                        ON CONFLICT (player_id) DO UPDATE SET
+                            rides = player_spend.rides + 1,
+                            spent = player_spend.spent + EXCLUDED.spent;
+                    ELSE
+                        IF NOT EXISTS (
+                            SELECT 1 FROM taxi_orders
+                            WHERE player_id = o.player_id AND taxi_id = o.taxi_id AND id <> o.id
+                              AND status IS DISTINCT FROM 'failed' AND COALESCE(created_at, NOW())::date = d
+                        ) THEN
+                            DELETE FROM taxi_daily_riders WHERE day = d AND taxi_id = o.taxi_id AND player_id = o.player_id;
+                            IF FOUND THEN rider_delta := 1; END IF;
+                        END IF;
+
+                        UPDATE taxi_daily SET
+                            rides = rides - 1,
+                            revenue = revenue - ride_price,
+                            unique_riders = unique_riders - rider_delta
+                        WHERE day = d AND taxi_id = o.taxi_id;
+
+                        UPDATE player_spend SET
+                            rides = rides - 1,
+                            spent = spent - ride_price
+                        WHERE player_id = o.player_id;
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS trg_rollup_order ON orders;
+                CREATE TRIGGER trg_rollup_order AFTER INSERT OR UPDATE OF status OR DELETE ON orders
+                FOR EACH ROW EXECUTE FUNCTION rollup_order();
+            """)
+            cur.execute("""
+                DROP TRIGGER IF EXISTS trg_rollup_taxi_order ON taxi_orders;
+                CREATE TRIGGER trg_rollup_taxi_order AFTER INSERT OR UPDATE OF status OR DELETE ON taxi_orders
+                FOR EACH ROW EXECUTE FUNCTION rollup_taxi_order();
+            """)
+            cur.execute("SELECT 1 FROM settings WHERE key = %s", (ANALYTICS_BACKFILL_SETTING,))
+            if cur.fetchone() is None:
+                backfill_analytics(cur)
+            cur.execute("SELECT 1 FROM settings WHERE key = 'player_spend_backfilled'")
+            if cur.fetchone() is None:
+                backfill_player_spend(cur)
+
+            cur.execute("""
+                INSERT INTO settings (key, value, updated_at) VALUES (%s, %s, NOW())
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+            """, (SCHEMA_SETTING, str(SCHEMA_VERSION)))
+            cur.execute("DELETE FROM settings WHERE key = 'schema_fingerprint'")  # replaced by schema_version
+
         conn.commit()
     print("✅ Database schema checked/updated (players, shop, orders, taxis)")
 
 
 
         
+def backfill_analytics(cur):
+    """Rebuild every rollup from orders/taxi_orders. Blocks new orders until the caller commits."""
+    cur.execute("LOCK TABLE orders, taxi_orders IN SHARE ROW EXCLUSIVE MODE;")
+    cur.execute("""
+        TRUNCATE sales_daily_item, taxi_daily,
+                 sales_daily_buyers, sales_daily_item_buyers, taxi_daily_riders;
+    """)
+    cur.execute("""
+        INSERT INTO sales_daily_buyers
+        SELECT DISTINCT COALESCE(timestamp, NOW())::date, player_id FROM orders
+        WHERE status IS DISTINCT FROM 'failed';
+    """)
+    cur.execute("""
+        INSERT INTO sales_daily_item_buyers
+        SELECT DISTINCT COALESCE(timestamp, NOW())::date, item_id, player_id FROM orders
+        WHERE status IS DISTINCT FROM 'failed';
+    """)
+    cur.execute("""
+        INSERT INTO sales_daily_item (day, item_id, item_name, category, orders, quantity, revenue, unique_buyers)
+        SELECT COALESCE(o.timestamp, NOW())::date, o.item_id, MAX(si.name), MAX(COALESCE(si.category, 'Misc')),
+               COUNT(*), SUM(o.quantity), COALESCE(SUM(o.total_price), 0), COUNT(DISTINCT o.player_id)
+        FROM orders o
+        LEFT JOIN shop_items si ON si.id = o.item_id
+        WHERE o.status IS DISTINCT FROM 'failed'
+        GROUP BY 1, 2;
+    """)
+    cur.execute("""
+        INSERT INTO taxi_daily_riders
+        SELECT DISTINCT COALESCE(created_at, NOW())::date, taxi_id, player_id FROM taxi_orders
+        WHERE status IS DISTINCT FROM 'failed';
+    """)
+    cur.execute("""
+        INSERT INTO taxi_daily (day, taxi_id, taxi_name, rides, revenue, unique_riders)
+        SELECT COALESCE(o.created_at, NOW())::date, o.taxi_id, MAX(t.name),
+               COUNT(*), COALESCE(SUM(t.price), 0), COUNT(DISTINCT o.player_id)
+        FROM taxi_orders o
+        LEFT JOIN taxis t ON t.id = o.taxi_id
+        WHERE o.status IS DISTINCT FROM 'failed'
+        GROUP BY 1, 2;
+    """)
+    cur.execute("""
+        INSERT INTO settings (key, value) VALUES (%s, NOW()::text)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW();
+    """, (ANALYTICS_BACKFILL_SETTING,))
+    backfill_player_spend(cur)
+    print("📊 Sales analytics rollups backfilled")
+
+
+def backfill_player_spend(cur):
+    """Rebuild lifetime spend per player from orders/taxi_orders (same locking as backfill_analytics)."""
+    cur.execute("LOCK TABLE orders, taxi_orders IN SHARE ROW EXCLUSIVE MODE;")
+    cur.execute("TRUNCATE player_spend;")
+    cur.execute("""
+        INSERT INTO player_spend (player_id, orders, rides, spent)
+        SELECT player_id, SUM(orders), SUM(rides), SUM(spent)
+        FROM (
+            SELECT player_id, COUNT(*) AS orders, 0 AS rides, COALESCE(SUM(total_price), 0) AS spent
+            FROM orders WHERE status IS DISTINCT FROM 'failed' GROUP BY player_id
+            UNION ALL
+            SELECT o.player_id, 0, COUNT(*), COALESCE(SUM(t.price), 0)
+            FROM taxi_orders o LEFT JOIN taxis t ON t.id = o.taxi_id
+            WHERE o.status IS DISTINCT FROM 'failed'
+            GROUP BY o.player_id
+        ) AS spend
+        GROUP BY player_id;
+    """)
+    cur.execute("""
+        INSERT INTO settings (key, value) VALUES ('player_spend_backfilled', NOW()::text)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW();
+    """)
+
+
+def get_sales_analytics(days=30, top=20):
+    """
+    Dashboard data for the last `days` days, read from the rollups only (cost grows with
+    the range shown, not with order history).
+    """
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            params = {"days": days, "top": top}
+            cur.execute("""
+                WITH days AS (
+                    SELECT generate_series(CURRENT_DATE - (%(days)s - 1), CURRENT_DATE, interval '1 day')::date AS day
+                ),
+                sales AS (
+                    SELECT day, SUM(orders) AS orders, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+                    FROM sales_daily_item
+                    WHERE day > CURRENT_DATE - %(days)s
+                    GROUP BY day
+                ),
+                buyers AS (
+                    SELECT day, COUNT(*) AS unique_buyers
+                    FROM sales_daily_buyers
+                    WHERE day > CURRENT_DATE - %(days)s
+                    GROUP BY day
+                ),
+                taxi AS (
+                    SELECT day, SUM(rides) AS rides, SUM(revenue) AS revenue
+                    FROM taxi_daily
+                    WHERE day > CURRENT_DATE - %(days)s
+                    GROUP BY day
+                )
+                SELECT d.day,
+                       COALESCE(s.orders, 0) AS orders,
+                       COALESCE(s.quantity, 0) AS quantity,
+                       COALESCE(s.revenue, 0) AS revenue,
+                       COALESCE(b.unique_buyers, 0) AS unique_buyers,
+                       COALESCE(t.rides, 0) AS taxi_rides,
+                       COALESCE(t.revenue, 0) AS taxi_revenue
+                FROM days d
+                LEFT JOIN sales s ON s.day = d.day
+                LEFT JOIN buyers b ON b.day = d.day
+                LEFT JOIN taxi t ON t.day = d.day
+                ORDER BY d.day DESC
+            """, params)
+            daily = cur.fetchall()
+
+            cur.execute("""
+                SELECT item_id, MAX(item_name) AS name, MAX(category) AS category,
+                       SUM(orders) AS orders, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+                FROM sales_daily_item
+                WHERE day > CURRENT_DATE - %(days)s
+                GROUP BY item_id
+                ORDER BY revenue DESC
+                LIMIT %(top)s
+            """, params)
+            top_items = cur.fetchall()
+
+            cur.execute("""
+                SELECT category, SUM(orders) AS orders, SUM(quantity) AS quantity, SUM(revenue) AS revenue
+                FROM sales_daily_item
+                WHERE day > CURRENT_DATE - %(days)s
+                GROUP BY category
+                ORDER BY revenue DESC
+            """, params)
+            categories = cur.fetchall()
+
+            cur.execute("""
+                SELECT taxi_id, MAX(taxi_name) AS name, SUM(rides) AS rides, SUM(revenue) AS revenue
+                FROM taxi_daily
+                WHERE day > CURRENT_DATE - %(days)s
+                GROUP BY taxi_id
+                ORDER BY rides DESC
+            """, params)
+            taxis = cur.fetchall()
+
+    return {"daily": daily, "top_items": top_items, "categories": categories, "taxis": taxis}
+
+
+# ─── Leaderboards ────────────────────────────────────
+def refresh_leaderboards(size=10):
+    """
+    Rebuild the ranked snapshots from the current top `size` per board. Both queries are
+    index-backed top-N scans (players.balance, player_spend.spent). The snapshot is only
+    rewritten when a ranking changed, in one transaction so readers see either the old or
+    the new one; an unchanged ranking leaves table_versions (and the admin page ETag) alone.
+    Returns the rows like get_leaderboards().
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT 'wealth', ROW_NUMBER() OVER (ORDER BY balance DESC, id), id, discord_id,
+                       COALESCE(NULLIF(scum_username, ''), discord_username), balance
+                FROM (
+                    SELECT * FROM players WHERE balance > 0 ORDER BY balance DESC, id LIMIT %(size)s
+                ) AS top
+                UNION ALL
+                SELECT 'spenders', ROW_NUMBER() OVER (ORDER BY top.spent DESC, top.player_id), top.player_id,
+                       p.discord_id, COALESCE(NULLIF(p.scum_username, ''), p.discord_username), top.spent
+                FROM (
+                    SELECT * FROM player_spend WHERE spent > 0 ORDER BY spent DESC, player_id LIMIT %(size)s
+                ) AS top
+                JOIN players p ON p.id = top.player_id;
+            """, {"size": size})
+            fresh = sorted(tuple(row) for row in cur.fetchall())
+            cur.execute("""
+                SELECT board, rank, player_id, discord_id, name, value
+                FROM leaderboard_snapshots
+                ORDER BY board, rank
+            """)
+            if [tuple(row) for row in cur.fetchall()] != fresh:
+                cur.execute("DELETE FROM leaderboard_snapshots;")
+                if fresh:
+                    psycopg2.extras.execute_values(cur, """
+                        INSERT INTO leaderboard_snapshots (board, rank, player_id, discord_id, name, value)
+                        VALUES %s
+                    """, fresh)
+        conn.commit()
+    return get_leaderboards()
+
+
+def get_leaderboards():
+    """Latest snapshots as {board: [{"rank", "player_id", "discord_id", "name", "value", "refreshed_at"}, ...]}."""
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT board, rank, player_id, discord_id, name, value, refreshed_at
+                FROM leaderboard_snapshots
+                ORDER BY board, rank
+            """)
+            rows = cur.fetchall()
+    boards = {board: [] for board in LEADERBOARDS}
+    for row in rows:
+        boards.setdefault(row.pop("board"), []).append(row)
+    return boards
+
+
 def get_all_players():
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -129,24 +812,81 @@ def get_all_players():
             ]
 
 
+# ─── Player identity cache ───────────────────────────
+def _cached_player(discord_id):
+    with _player_cache_lock:
+        entry = _player_cache.get(discord_id)
+        if not entry:
+            return None
+        if entry[3] < time.monotonic():
+            del _player_cache[discord_id]
+            return None
+        _player_cache.move_to_end(discord_id)
+        return entry
+
+
+def _cache_player(discord_id, player_id, scum_username, discord_username):
+    if PLAYER_CACHE_TTL <= 0:
+        return
+    with _player_cache_lock:
+        _player_cache[discord_id] = (player_id, scum_username, discord_username, time.monotonic() + PLAYER_CACHE_TTL)
+        _player_cache.move_to_end(discord_id)
+        while len(_player_cache) > PLAYER_CACHE_SIZE:
+            _player_cache.popitem(last=False)
+
+
+def invalidate_player(discord_id, cur=None):
+    """
+    Drop discord_id from this process's cache. With the writer's cursor it also NOTIFYs the
+    bot processes (they LISTEN on PLAYER_NOTIFY_CHANNEL) once that transaction commits.
+    """
+    with _player_cache_lock:
+        _player_cache.pop(int(discord_id), None)
+    if cur is not None:
+        cur.execute("SELECT pg_notify(%s, %s)", (
+            PLAYER_NOTIFY_CHANNEL, json.dumps({"kind": "invalidate_player", "payload": int(discord_id)})))
+
+
 def get_or_create_player(discord_id, scum_username, discord_username=None):
+    """
+    Return the player id for discord_id, creating the player if needed. Only writes when
+    the player is new or their Discord username changed; repeat calls are served from cache.
+    """
+    discord_id = int(discord_id)
+    cached = _cached_player(discord_id)
+    if cached and (not discord_username or cached[2] == discord_username):
+        return cached[0]
+
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id FROM players WHERE discord_id = %s", (discord_id,))
-            result = cur.fetchone()
-            if result:
-                # Optional: Update discord_username if it changed
-                if discord_username:
-                    cur.execute("UPDATE players SET discord_username = %s WHERE discord_id = %s", (discord_username, discord_id))
-                    conn.commit()
-                return result[0]
-            else:
-                cur.execute(
-                    "INSERT INTO players (discord_id, scum_username, discord_username) VALUES (%s, %s, %s) RETURNING id",
-                    (discord_id, scum_username, discord_username)
-                )
+            cur.execute(
+                "SELECT id, scum_username, discord_username FROM players WHERE discord_id = %s",
+                (discord_id,)
+            )
+            row = cur.fetchone()
+            if row is None or (discord_username and row[2] != discord_username):
+                # One statement covers create, rename and a concurrent insert of the same player;
+                # the WHERE skips the write when nothing changed.
+                cur.execute("""
+                    INSERT INTO players (discord_id, scum_username, discord_username)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (discord_id) DO UPDATE
+                    SET discord_username = EXCLUDED.discord_username
+                    WHERE EXCLUDED.discord_username IS NOT NULL
+                      AND players.discord_username IS DISTINCT FROM EXCLUDED.discord_username
+                    RETURNING id, scum_username, discord_username
+                """, (discord_id, scum_username, discord_username))
+                row = cur.fetchone()
                 conn.commit()
-                return cur.fetchone()[0]
+                if row is None:
+                    cur.execute(
+                        "SELECT id, scum_username, discord_username FROM players WHERE discord_id = %s",
+                        (discord_id,)
+                    )
+                    row = cur.fetchone()
+
+    _cache_player(discord_id, *row)
+    return row[0]
 
 
 def get_player_by_discord_id(discord_id):
@@ -168,6 +908,7 @@ def remove_player(discord_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM players WHERE discord_id = %s", (discord_id,))
+            invalidate_player(discord_id, cur)
 
 def delete_orders_by_discord_id(discord_id):
     with get_connection() as conn:
@@ -201,6 +942,7 @@ def update_player(discord_id, scum_username, balance):
                 SET scum_username = %s, balance = %s
                 WHERE discord_id = %s
             """, (scum_username, balance, discord_id))
+            invalidate_player(discord_id, cur)
             conn.commit()
 
 # bank view helper functions
@@ -260,6 +1002,75 @@ def get_shop_items():
             ]
 
 
+def search_shop_items(query, category=None, page=1, per_page=50):
+    """
+    Ranked search over name, category, description and content commands.
+    Full-text matches (name weighted highest) are combined with trigram similarity on
+    the name, so typos and partial names still match. Returns
+    {"items": [...], "total": n, "facets": [(category, count), ...]}; facets ignore the
+    category filter so they can be used to switch between categories.
+    """
+    query = (query or "").strip()
+    params = {
+        "q": query,
+        "like": f"%{query}%",
+        "category": category or None,
+        "limit": per_page,
+        "offset": max(page - 1, 0) * per_page,
+    }
+    matches = """
+        WITH q AS (SELECT websearch_to_tsquery('simple', %(q)s) AS tsq),
+        matches AS (
+            SELECT si.id, si.name, si.category, si.price, si.image_url, si.description, si.content,
+                   CASE WHEN %(q)s = '' THEN 0
+                        ELSE ts_rank(si.search_vector, q.tsq) * 2 + similarity(si.name, %(q)s)
+                   END AS rank
+            FROM shop_items si, q
+            WHERE %(q)s = ''
+               OR si.search_vector @@ q.tsq
+               OR si.name %% %(q)s
+               OR si.name ILIKE %(like)s
+        )
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(matches + """
+                SELECT id, name, category, price, image_url, description, content, COUNT(*) OVER () AS total
+                FROM matches
+                WHERE %(category)s::text IS NULL OR category = %(category)s
+                ORDER BY rank DESC, name ASC
+                LIMIT %(limit)s OFFSET %(offset)s
+            """, params)
+            rows = cur.fetchall()
+
+            cur.execute(matches + """
+                SELECT COALESCE(category, 'Misc'), COUNT(*)
+                FROM matches
+                GROUP BY 1
+                ORDER BY 2 DESC, 1 ASC
+            """, params)
+            facets = cur.fetchall()
+
+    items = []
+    for row in rows:
+        content = row[6]
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except json.JSONDecodeError:
+                content = [line for line in content.splitlines() if line.strip()]
+        items.append({
+            "id": row[0],
+            "name": row[1],
+            "category": row[2],
+            "price": row[3],
+            "image_url": row[4],
+            "description": row[5],
+            "content": content,
+        })
+    return {"items": items, "total": rows[0][7] if rows else 0, "facets": facets}
+
+
 def get_shop_item_by_id(item_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -294,8 +1105,12 @@ def add_shop_item(name, category, price, image_url, description, content):
             cur.execute("""
                 INSERT INTO shop_items (name, category, price, image_url, description, content)
                 VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
             """, (name, category, price, image_url, description, json.dumps(content)))
+            item_id = cur.fetchone()[0]
+            enqueue_outbox(cur, "item_created", item_id, {"name": name})
             conn.commit()
+            return item_id
 
 
 def update_shop_item(item_id, name, category, price, image_url, description, content):
@@ -307,27 +1122,115 @@ def update_shop_item(item_id, name, category, price, image_url, description, con
                     image_url = %s, description = %s, content = %s
                 WHERE id = %s
             """, (name, category, price, image_url, description, json.dumps(content), item_id))
+            if cur.rowcount:
+                enqueue_outbox(cur, "item_updated", item_id, {"name": name})
             conn.commit()
 
 
 def delete_shop_item(item_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM shop_items WHERE id = %s", (item_id,))
+            cur.execute("DELETE FROM shop_items WHERE id = %s RETURNING name, message_id", (item_id,))
+            for name, message_id in cur.fetchall():
+                enqueue_outbox(cur, "item_deleted", item_id, {"name": name, "message_id": message_id})
             conn.commit()
 
 def set_item_price(name, price):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("UPDATE shop_items SET price = %s WHERE LOWER(name) = LOWER(%s)", (price, name))
+            cur.execute("UPDATE shop_items SET price = %s WHERE LOWER(name) = LOWER(%s) RETURNING id", (price, name))
+            for (item_id,) in cur.fetchall():
+                enqueue_outbox(cur, "item_updated", item_id, {"name": name, "price": str(price)})
             conn.commit()
 
 def remove_shop_item(name):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("DELETE FROM shop_items WHERE LOWER(name) = LOWER(%s)", (name,))
+            cur.execute("DELETE FROM shop_items WHERE LOWER(name) = LOWER(%s) RETURNING id, message_id", (name,))
+            for item_id, message_id in cur.fetchall():
+                enqueue_outbox(cur, "item_deleted", item_id, {"name": name, "message_id": message_id})
             conn.commit()
 
+# ─── Bulk catalog operations ─────────────────────────
+# Each runs as one set-based statement in a single transaction and queues a single outbox
+# event, so the bot does one shop sync however many items changed.
+def _bulk_scope(item_ids=None, category=None):
+    if item_ids:
+        return "id = ANY(%s)", [list(item_ids)]
+    if category:
+        return "COALESCE(category, 'Misc') = %s", [category]
+    raise ValueError("Select items or a category first")
+
+
+def bulk_reprice_items(mode, value, item_ids=None, category=None):
+    """mode: 'percent' (±value %), 'delta' (±value) or 'set' (= value). Prices never go below 0. Returns rows changed."""
+    expressions = {
+        "percent": "ROUND(price * (1 + %s / 100.0))",
+        "delta": "price + %s",
+        "set": "%s",
+    }
+    if mode not in expressions:
+        raise ValueError(f"Unknown reprice mode: {mode}")
+    where, params = _bulk_scope(item_ids, category)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            new_price = f"GREATEST(0, {expressions[mode]})"
+            cur.execute(
+                f"UPDATE shop_items SET price = {new_price} WHERE {where} AND price IS DISTINCT FROM {new_price}",
+                [value] + params + [value]
+            )
+            changed = cur.rowcount
+            if changed:
+                enqueue_outbox(cur, "catalog_bulk", payload={"op": "reprice", "mode": mode, "value": str(value), "count": changed})
+            conn.commit()
+    return changed
+
+
+def bulk_move_items(new_category, item_ids=None, category=None):
+    where, params = _bulk_scope(item_ids, category)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE shop_items SET category = %s WHERE {where} AND category IS DISTINCT FROM %s",
+                [new_category] + params + [new_category]
+            )
+            changed = cur.rowcount
+            if changed:
+                enqueue_outbox(cur, "catalog_bulk", payload={"op": "move", "category": new_category, "count": changed})
+            conn.commit()
+    return changed
+
+
+def bulk_delete_items(item_ids=None, category=None, delete_orders=False):
+    """
+    Delete the selected items. Items with orders are kept unless delete_orders is set, in
+    which case their orders go too. Returns (deleted, kept_because_of_orders).
+    """
+    where, params = _bulk_scope(item_ids, category)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if delete_orders:
+                cur.execute(f"DELETE FROM orders WHERE item_id IN (SELECT id FROM shop_items WHERE {where})", params)
+                cur.execute(f"DELETE FROM shop_items WHERE {where}", params)
+                kept = 0
+            else:
+                cur.execute(f"""
+                    WITH doomed AS (
+                        SELECT id FROM shop_items si
+                        WHERE {where} AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.item_id = si.id)
+                    )
+                    DELETE FROM shop_items WHERE id IN (SELECT id FROM doomed)
+                """, params)
+            deleted = cur.rowcount
+            if not delete_orders:
+                cur.execute(f"SELECT COUNT(*) FROM shop_items WHERE {where}", params)
+                kept = cur.fetchone()[0]
+            if deleted:
+                enqueue_outbox(cur, "catalog_bulk", payload={"op": "delete", "count": deleted})
+            conn.commit()
+    return deleted, kept
+
+
 def delete_orders_by_item_id(item_id):
     with get_connection() as conn:
         with conn.cursor() as cur:
@@ -337,7 +1240,9 @@ def delete_orders_by_item_id(item_id):
 def edit_shop_item(old_name, new_name):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("UPDATE shop_items SET name = %s WHERE LOWER(name) = LOWER(%s)", (new_name, old_name))
+            cur.execute("UPDATE shop_items SET name = %s WHERE LOWER(name) = LOWER(%s) RETURNING id", (new_name, old_name))
+            for (item_id,) in cur.fetchall():
+                enqueue_outbox(cur, "item_updated", item_id, {"name": new_name})
             conn.commit()
 
 def import_shop_items(items):
@@ -352,6 +1257,8 @@ def import_shop_items(items):
                         category = EXCLUDED.category,
                         image_url = EXCLUDED.image_url
                 """, (item["name"], item["price"], item.get("category", "Misc"), item.get("image_url")))
+            if items:
+                enqueue_outbox(cur, "catalog_imported", payload={"count": len(items)})
             conn.commit()
 
 def export_shop_items():
@@ -419,21 +1326,63 @@ def save_order_to_db(player_id, item_id, quantity):
 def update_order_status(order_id, new_status):
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("UPDATE orders SET status = %s WHERE id = %s", (new_status, order_id))
+            cur.execute("""
+                UPDATE orders
+                SET status = %s,
+                    delivered_at = CASE WHEN %s = 'delivered' THEN CURRENT_TIMESTAMP ELSE delivered_at END
+                WHERE id = %s
+            """, (new_status, new_status, order_id))
             conn.commit()
 
 
-# Save message/channel ID to a shop item
-def update_shop_item_message_info(item_id, message_id, channel_id):
+# Save message/channel ID (and the hash of what was rendered) to a shop item
+def update_shop_item_message_info(item_id, message_id, channel_id, embed_hash=None):
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 UPDATE shop_items
-                SET message_id = %s, channel_id = %s
+                SET message_id = %s, channel_id = %s, embed_hash = %s
                 WHERE id = %s
-            """, (message_id, channel_id, item_id))
+            """, (message_id, channel_id, embed_hash, item_id))
             conn.commit()
 
+# Same for several items sharing one message (packed shop layout)
+def update_shop_items_message_info(item_ids, message_id, channel_id, embed_hash=None):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE shop_items
+                SET message_id = %s, channel_id = %s, embed_hash = %s
+                WHERE id = ANY(%s)
+            """, (message_id, channel_id, embed_hash, list(item_ids)))
+            conn.commit()
+
+# All shop items with their posted message info, for channel reconciliation
+def get_shop_items_for_sync():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, name, category, price, image_url, description, content,
+                       message_id, channel_id, embed_hash
+                FROM shop_items
+                ORDER BY name ASC
+            """)
+            return [
+                {
+                    "id": row[0],
+                    "name": row[1],
+                    "category": row[2],
+                    "price": row[3],
+                    "image_url": row[4],
+                    "description": row[5],
+                    "content": row[6],
+                    "message_id": row[7],
+                    "channel_id": row[8],
+                    "embed_hash": row[9],
+                }
+                for row in cur.fetchall()
+            ]
+
 # Get full shop item with message/channel ID
 def get_shop_item_with_message(item_id):
     with get_connection() as conn:
@@ -537,3 +1486,187 @@ def mark_taxi_order_status(conn, order_id, status):
             "UPDATE taxi_orders SET status=%s, completed_at=NOW() WHERE id=%s;",
             (status, order_id)
         )
+
+
+# ===============================
+# Rate Limit Database Functions
+# ===============================
+
+def take_rate_limit_token(key, capacity, rate, ttl):
+    """
+    Refill the bucket for `key` at `rate` tokens/s (capped at `capacity`) and take one token
+    if available, in a single UPSERT so concurrent bot processes can't double-spend.
+    Returns (allowed, tokens_left). Expired buckets start over full.
+    """
+    # Refilled token count of the existing (locked) row; referenced several times below
+    refilled = """
+        CASE WHEN rate_limits.expires_at < NOW() THEN %(capacity)s::float8
+             ELSE LEAST(%(capacity)s::float8,
+                        rate_limits.tokens + EXTRACT(EPOCH FROM NOW() - rate_limits.updated_at) * %(rate)s)
+        END
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO rate_limits (key, tokens, allowed, updated_at, expires_at)
+                VALUES (%(key)s, %(capacity)s - 1, TRUE, NOW(), NOW() + make_interval(secs => %(ttl)s))
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END,
+                    allowed = {refilled} >= 1,
+                    updated_at = NOW(),
+                    expires_at = NOW() + make_interval(secs => %(ttl)s)
+                RETURNING allowed, tokens;
+            """, {"key": key, "capacity": capacity, "rate": rate, "ttl": ttl})
+            allowed, tokens = cur.fetchone()
+        conn.commit()
+    return allowed, tokens
+
+
+def purge_expired_rate_limits():
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM rate_limits WHERE expires_at < NOW();")
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+# ===============================
+# Shared Bot State
+# ===============================
+
+def get_setting(key, default=None):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT value FROM settings WHERE key = %s", (key,))
+            row = cur.fetchone()
+            return row[0] if row else default
+
+
+def set_setting(key, value):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO settings (key, value, updated_at) VALUES (%s, %s, NOW())
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+            """, (key, None if value is None else str(value)))
+        conn.commit()
+
+
+def notify(channel, payload):
+    """Postgres NOTIFY; delivered to every connection LISTENing on `channel` once committed."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+        conn.commit()
+
+
+# ===============================
+# Bot Outbox
+# ===============================
+# Catalog writers call enqueue_outbox() with their own cursor so the event commits (or rolls
+# back) together with the change. The bot claims events with a lease (status 'processing'),
+# publishes them and marks them done; failures are retried with exponential backoff until
+# max_attempts. An identical event still pending is collapsed into the existing row.
+
+OUTBOX_NOTIFY_CHANNEL = "scumbot_api"  # same channel the bot already LISTENs on (cluster.API_CHANNEL)
+
+
+def enqueue_outbox(cur, event, item_id=None, payload=None):
+    payload = payload or {}
+    body = json.dumps(payload, sort_keys=True, default=str)
+    # Same event for the same item with the same payload while still pending = duplicate
+    key = hashlib.sha1(f"{event}:{item_id}:{body}".encode("utf-8")).hexdigest()
+    cur.execute("""
+        INSERT INTO bot_outbox (event, item_id, payload, idempotency_key)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) WHERE status = 'pending' DO NOTHING
+    """, (event, item_id, body, key))
+    # Delivered on commit only, so the bot never wakes up for a rolled-back change
+    cur.execute("SELECT pg_notify(%s, %s)", (OUTBOX_NOTIFY_CHANNEL, json.dumps({"kind": "outbox"})))
+
+
+def claim_outbox_events(limit=100, lease_seconds=120):
+    """
+    Lease up to `limit` due events (SKIP LOCKED, so several dispatchers never share one).
+    Events whose lease ran out (dispatcher died mid-batch) are claimed again.
+    """
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                UPDATE bot_outbox
+                SET status = 'processing',
+                    claimed_until = NOW() + make_interval(secs => %s),
+                    attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM bot_outbox
+                    WHERE (status = 'pending' AND available_at <= NOW())
+                       OR (status = 'processing' AND claimed_until < NOW())
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, event, item_id, payload, idempotency_key, attempts
+            """, (lease_seconds, limit))
+            events = sorted(cur.fetchall(), key=lambda e: e["id"])
+        conn.commit()
+    return events
+
+
+def complete_outbox_events(event_ids):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE bot_outbox
+                SET status = 'done', processed_at = NOW(), claimed_until = NULL, last_error = NULL
+                WHERE id = ANY(%s)
+            """, (list(event_ids),))
+        conn.commit()
+
+
+def fail_outbox_events(event_ids, error, max_attempts):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # A newer identical pending event already covers a failed one, so that one is closed
+            cur.execute("""
+                UPDATE bot_outbox o
+                SET claimed_until = NULL,
+                    last_error = %(error)s,
+                    available_at = NOW() + make_interval(secs => LEAST(300, power(2, o.attempts))),
+                    status = CASE
+                        WHEN o.attempts >= %(max)s THEN 'failed'
+                        WHEN EXISTS (
+                            SELECT 1 FROM bot_outbox p
+                            WHERE p.idempotency_key = o.idempotency_key AND p.status = 'pending'
+                        ) THEN 'done'
+                        ELSE 'pending'
+                    END,
+                    processed_at = CASE WHEN o.attempts >= %(max)s THEN NOW() END
+                WHERE o.id = ANY(%(ids)s)
+            """, {"error": str(error)[:1000], "max": max_attempts, "ids": list(event_ids)})
+        conn.commit()
+
+
+def purge_outbox(keep_days=7):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM bot_outbox
+                WHERE status IN ('done', 'failed')
+                  AND COALESCE(processed_at, created_at) < NOW() - make_interval(days => %s)
+            """, (keep_days,))
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+def get_table_versions(tables):
+    """{table: (version, updated_at)} for change-counted tables; unseen tables are (0, None)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name, version, updated_at FROM table_versions WHERE table_name = ANY(%s)",
+                (list(tables),)
+            )
+            found = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+    return {table: found.get(table, (0, None)) for table in tables}
@@ -0,0 +1,166 @@
+# instrumentation.py – lightweight latency instrumentation for the Discord cog
+#
+# Wraps app commands, button/modal callbacks and db.* functions with wall-clock timers
+# and renders the results in Prometheus text format for the internal API's /metrics route.
+# When BOT_METRICS_ENABLED is not "true" every decorator returns the function untouched,
+# so the disabled path costs nothing per call.
+
+import os
+import time
+import functools
+import inspect
+import threading
+
+import discord
+
+ENABLED = os.getenv("BOT_METRICS_ENABLED", "false").lower() == "true"
+
+# Discord gives interactions 3 s before the token's initial response window closes
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # (kind, name) -> [bucket counts..., sum, count]
+_counters = {}    # (metric, (label pairs)) -> value
+
+
+# ─── RECORDING ───────────────────────────────────────────────
+def observe(kind, name, seconds):
+    with _lock:
+        series = _histograms.get((kind, name))
+        if series is None:
+            series = _histograms[(kind, name)] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+
+def count(metric, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + 1
+
+
+def _find_interaction(args):
+    for arg in args:
+        if isinstance(arg, discord.Interaction):
+            return arg
+    return None
+
+
+def _response_outcome(interaction, error):
+    """Classify how an interaction was answered: responded, deferred, timed_out or unanswered."""
+    if isinstance(error, discord.NotFound) and error.code == 10062:  # Unknown interaction
+        return "timed_out"
+    if interaction.response.is_done():
+        deferred = (
+            discord.InteractionResponseType.deferred_channel_message,
+            discord.InteractionResponseType.deferred_message_update,
+        )
+        return "deferred" if getattr(interaction.response, "type", None) in deferred else "responded"
+    return "unanswered"
+
+
+# ─── DECORATORS ──────────────────────────────────────────────
+def timed(kind, name=None):
+    """Time a sync or async function as one step (e.g. `timed("step", "is_admin")`)."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        step = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    count("scumbot_step_errors_total", kind=kind, name=step)
+                    raise
+                finally:
+                    observe(kind, step, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                count("scumbot_step_errors_total", kind=kind, name=step)
+                raise
+            finally:
+                observe(kind, step, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def interaction(name):
+    """
+    Time an interaction handler (app command, button callback or modal submit) and
+    count how it was answered. Apply it below @app_commands.command so the command
+    still sees the original signature through functools.wraps.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                observe("interaction", name, time.perf_counter() - start)
+                inter = _find_interaction(args)
+                if inter is not None:
+                    count("scumbot_interaction_responses_total", name=name, outcome=_response_outcome(inter, error))
+                    # Time from Discord creating the interaction to the handler finishing
+                    age = (discord.utils.utcnow() - inter.created_at).total_seconds()
+                    observe("interaction_age", name, max(age, 0.0))
+        return wrapper
+    return decorator
+
+
+def instrument_module(module, kind="db"):
+    """Replace every public function defined in `module` with a timed wrapper (callers use module.attr)."""
+    if not ENABLED:
+        return
+    for attr, value in list(vars(module).items()):
+        if attr.startswith("_") or not inspect.isfunction(value):
+            continue
+        if value.__module__ != module.__name__ or hasattr(value, "__wrapped__"):
+            continue
+        setattr(module, attr, timed(kind, attr)(value))
+
+
+# ─── EXPORT ──────────────────────────────────────────────────
+def render():
+    """Prometheus text exposition of everything recorded so far."""
+    lines = [
+        "# HELP scumbot_step_seconds Wall time per interaction, step and db call.",
+        "# TYPE scumbot_step_seconds histogram",
+    ]
+    with _lock:
+        for (kind, name), series in sorted(_histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            for bound, n in zip(BUCKETS, series):
+                lines.append(f'scumbot_step_seconds_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f'scumbot_step_seconds_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"scumbot_step_seconds_sum{{{labels}}} {series[-2]:.6f}")
+            lines.append(f"scumbot_step_seconds_count{{{labels}}} {series[-1]}")
+
+        typed = set()
+        for (metric, labels), value in sorted(_counters.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+# internal_api.py – async internal HTTP API for the admin portal (replaces the Flask thread)
+#
+# Served by aiohttp (already a discord.py dependency) on the bot's own event loop, so
+# handlers can await cog methods directly instead of handing work across threads.
+#
+#   POST /api/items/post      {"items": [item, ...]}  post new items (batched through the publisher)
+#   POST /api/items/refresh   {}                      reconcile the shop channel with the catalog
+#   POST /api/post_item       item                    single-item form kept for older callers
+#   POST /api/repost_taxis    {}                      purge and repost taxi buttons
+#   GET  /metrics                                     Prometheus text (BOT_METRICS_ENABLED=true)
+#
+# When INTERNAL_API_TOKEN is set every /api route requires "Authorization: Bearer <token>".
+# Jobs are accepted with 202 and run in the background; in a sharded deployment they are
+# forwarded to the process owning the home guild (see cluster.py).
+
+import os
+import hmac
+import asyncio
+
+from aiohttp import web
+
+import cluster
+import instrumentation
+
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+MAX_BATCH_ITEMS = 500
+
+
+# ─── VALIDATION ──────────────────────────────────────────────
+def validate_item(item):
+    """Return a list of problems with an item payload (empty when valid)."""
+    if not isinstance(item, dict):
+        return ["item must be an object"]
+    errors = []
+    if not isinstance(item.get("name"), str) or not item["name"].strip():
+        errors.append("name is required")
+    price = item.get("price")
+    if isinstance(price, str):
+        try:
+            price = float(price)
+        except ValueError:
+            price = None
+    if isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+        errors.append("price must be a non-negative number")
+    if item.get("id") is not None and not isinstance(item["id"], int):
+        errors.append("id must be an integer")
+    if not isinstance(item.get("content", []), (list, str)):
+        errors.append("content must be a list of commands or a string")
+    for field in ("category", "description", "image_url"):
+        if item.get(field) is not None and not isinstance(item[field], str):
+            errors.append(f"{field} must be a string")
+    return errors
+
+
+# ─── SERVER ──────────────────────────────────────────────────
+class InternalAPI:
+    def __init__(self, bot, run_job, guild_id, port, host="0.0.0.0"):
+        self.bot = bot
+        self.run_job = run_job  # async run_job(kind, payload), executed on the owning process
+        self.guild_id = guild_id
+        self.port = port
+        self.host = host
+        self.runner = None
+        self.tasks = set()  # keep references so background jobs aren't garbage collected
+
+        self.app = web.Application(middlewares=[self.auth_middleware], client_max_size=4 * 1024 * 1024)
+        self.app.add_routes([
+            web.post("/api/items/post", self.post_items),
+            web.post("/api/items/refresh", self.refresh_items),
+            web.post("/api/post_item", self.post_item),
+            web.post("/api/repost_taxis", self.repost_taxis),
+            web.get("/metrics", self.metrics),
+        ])
+
+    async def start(self):
+        if self.runner is not None:
+            return
+        if not INTERNAL_API_TOKEN:
+            print("⚠️ INTERNAL_API_TOKEN is not set — internal API accepts unauthenticated requests")
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"🌐 Internal API listening on port {self.port}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    @web.middleware
+    async def auth_middleware(self, request, handler):
+        if INTERNAL_API_TOKEN and request.path.startswith("/api/"):
+            supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(supplied, INTERNAL_API_TOKEN):
+                return web.json_response({"error": "Unauthorized"}, status=401)
+        return await handler(request)
+
+    def submit(self, kind, payload=None):
+        """Run locally when this process owns the home guild, otherwise forward to the owner."""
+        if not cluster.owns_guild(self.guild_id):
+            cluster.forward(kind, payload)
+            return
+        task = asyncio.create_task(self.run_job(kind, payload))
+        self.tasks.add(task)
+        task.add_done_callback(self._job_done)
+
+    def _job_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"❌ Internal API job failed: {task.exception()}")
+
+    async def _json(self, request):
+        if not request.can_read_body:
+            return {}
+        try:
+            return await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text='{"error": "Invalid JSON"}', content_type="application/json")
+
+    # ─── ROUTES ──────────────────────────────────────────────
+    async def post_items(self, request):
+        data = await self._json(request)
+        items = data.get("items") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return web.json_response({"error": "items must be a non-empty list"}, status=400)
+        if len(items) > MAX_BATCH_ITEMS:
+            return web.json_response({"error": f"at most {MAX_BATCH_ITEMS} items per request"}, status=400)
+
+        errors = {i: problems for i, item in enumerate(items) if (problems := validate_item(item))}
+        if errors:
+            return web.json_response({"error": "validation failed", "items": errors}, status=400)
+
+        if cluster.owns_guild(self.guild_id):
+            self.submit("post_items", items)
+        else:
+            # NOTIFY payloads are small; forward one item per message
+            for item in items:
+                self.submit("post_items", [item])
+        return web.json_response({"status": "accepted", "items": len(items)}, status=202)
+
+    async def post_item(self, request):
+        data = await self._json(request)
+        errors = validate_item(data)
+        if errors:
+            return web.json_response({"error": "validation failed", "details": errors}, status=400)
+        print(f"📨 Received /api/post_item: {data.get('name')}")
+        self.submit("post_items", [data])
+        return web.json_response({"status": "accepted"}, status=202)
+
+    async def refresh_items(self, request):
+        self.submit("sync_shop")
+        return web.json_response({"status": "accepted"}, status=202)
+
+    async def repost_taxis(self, request):
+        self.submit("repost_taxis")
+        return web.json_response({"status": "accepted"}, status=202)
+
+    async def metrics(self, request):
+        if not instrumentation.ENABLED:
+            return web.json_response({"error": "Metrics disabled (set BOT_METRICS_ENABLED=true)"}, status=404)
+        return web.Response(text=instrumentation.render(), content_type="text/plain")
@@ -0,0 +1,129 @@
+# item_index.py – in-memory prefix/trigram index over shop item names and categories
+#
+# Serves /buy autocomplete without touching Postgres on every keystroke. The index is
+# loaded once and then kept current with upsert()/remove(), or sync() with a fresh
+# catalog snapshot, which only touches the items that actually changed.
+
+import bisect
+import threading
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = {}        # item id -> {"id", "name", "category", "price"}
+        self._keys = {}        # item id -> (name key, word keys, category key, trigrams)
+        self._prefixes = []    # sorted (key, item id) for names, name words and categories
+        self._trigrams = {}    # trigram -> set(item ids)
+
+    def __len__(self):
+        return len(self.items)
+
+    # ─── MAINTENANCE ─────────────────────────────────────────
+    def upsert(self, item):
+        entry = {
+            "id": item["id"],
+            "name": item["name"],
+            "category": item.get("category") or "",
+            "price": item.get("price"),
+        }
+        with self._lock:
+            if self.items.get(item["id"]) == entry:
+                return False
+            self._remove_locked(item["id"])
+            self._add_locked(entry)
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            return self._remove_locked(item_id)
+
+    def sync(self, items):
+        """Bring the index in line with a full catalog snapshot. Returns (changed, removed) counts."""
+        seen = set()
+        changed = 0
+        for item in items:
+            seen.add(item["id"])
+            if self.upsert(item):
+                changed += 1
+        removed = 0
+        for item_id in [i for i in self.items if i not in seen]:
+            if self.remove(item_id):
+                removed += 1
+        return changed, removed
+
+    def _add_locked(self, entry):
+        name_key = entry["name"].lower()
+        word_keys = {w for w in name_key.replace("_", " ").replace("-", " ").split() if w and w != name_key}
+        category_key = entry["category"].lower()
+        grams = _trigrams(name_key)
+
+        self.items[entry["id"]] = entry
+        self._keys[entry["id"]] = (name_key, word_keys, category_key, grams)
+        for key in {name_key, category_key, *word_keys}:
+            if key:
+                bisect.insort(self._prefixes, (key, entry["id"]))
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(entry["id"])
+
+    def _remove_locked(self, item_id):
+        if item_id not in self.items:
+            return False
+        name_key, word_keys, category_key, grams = self._keys.pop(item_id)
+        del self.items[item_id]
+        for key in {name_key, category_key, *word_keys}:
+            if key:
+                i = bisect.bisect_left(self._prefixes, (key, item_id))
+                if i < len(self._prefixes) and self._prefixes[i] == (key, item_id):
+                    del self._prefixes[i]
+        for gram in grams:
+            ids = self._trigrams.get(gram)
+            if ids:
+                ids.discard(item_id)
+                if not ids:
+                    del self._trigrams[gram]
+        return True
+
+    # ─── SEARCH ──────────────────────────────────────────────
+    def search(self, query, limit=25):
+        """Ranked matches: exact > name prefix > word prefix > category prefix > trigram similarity."""
+        query = (query or "").strip().lower()
+        with self._lock:
+            if not query:
+                return sorted(self.items.values(), key=lambda e: e["name"].lower())[:limit]
+
+            candidates = set()
+            i = bisect.bisect_left(self._prefixes, (query, -1))
+            while i < len(self._prefixes) and self._prefixes[i][0].startswith(query):
+                candidates.add(self._prefixes[i][1])
+                i += 1
+
+            query_grams = _trigrams(query)
+            for gram in query_grams:
+                candidates.update(self._trigrams.get(gram, ()))
+
+            scored = []
+            for item_id in candidates:
+                name_key, word_keys, category_key, grams = self._keys[item_id]
+                similarity = len(query_grams & grams) / len(query_grams | grams)
+                if name_key == query:
+                    score = 100
+                elif name_key.startswith(query):
+                    score = 80
+                elif any(w.startswith(query) for w in word_keys):
+                    score = 60
+                elif category_key.startswith(query):
+                    score = 40
+                else:
+                    score = 0
+                score += similarity * 50
+                if score >= 10:  # drop weak trigram-only noise
+                    scored.append((-score, len(name_key), name_key, item_id))
+
+            scored.sort()
+            return [self.items[item_id] for _, _, _, item_id in scored[:limit]]
@@ -2,38 +2,58 @@
 
 import os
 import time
+import asyncio
 import discord
 import json
+import hashlib
+import datetime
 from discord import app_commands, Interaction, ButtonStyle
-from discord.ext import commands
-from discord.ui import Button, View
+from discord.ext import commands, tasks
+from discord.ui import Button, View, DynamicItem
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
-import threading
-import db
-from bank_view import BankView
 
+# Before the local modules: db, cluster, instrumentation and rate_limiter read their settings at import
+load_dotenv()
 
-print("💡 main.py starting up...")
+import db
+import cluster
+import instrumentation
+from bank_view import BankView
+from publisher import Publisher, PublishJob, InteractionProgress
+from item_index import ItemIndex
+from rate_limiter import RateLimiter
 
-load_dotenv()
+instrumentation.instrument_module(db)
 
 # ─── ENV CONFIG ──────────────────────────────────────────────
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 SHOP_LOG_CHANNEL_ID = int(os.getenv("SHOP_LOG_CHANNEL_ID"))
 PURCHASE_LOG_CHANNEL_ID = int(os.getenv("PURCHASE_LOG_CHANNEL_ID"))
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", 0))
-COMMAND_RELAY_FILE = os.getenv("COMMAND_RELAY_FILE", "outgoing_commands.txt")
 ADMIN_ROLE_NAME = os.getenv("ADMIN_ROLE_NAME", "Admin")
-COOLDOWN_SECONDS = 60
 GUILD_ID = int(os.getenv("DISCORD_GUILD_ID"))
 BANK_CHANNEL_ID = int(os.getenv("BANK_CHANNEL_ID"))
 BOT_STATUS_CHANNEL_ID = int(os.getenv("BOT_STATUS_CHANNEL_ID"))
-last_status_message_id = None  # store the message ID so we can edit it later
 TAXI_CHANNEL_ID = int(os.getenv("TAXI_CHANNEL_ID", 0))  # taxi posting channel (e.g., 1408626703206580246)
+SHOP_LAYOUT = os.getenv("SHOP_LAYOUT", "item").lower()  # "item" = one message per item, "packed" = grouped by category
+SHOP_PACK_SIZE = max(1, min(int(os.getenv("SHOP_PACK_SIZE", "10")), 10))  # Discord allows 10 embeds per message
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "300"))  # seconds an admin-role lookup stays cached
+MEMBERS_INTENT = os.getenv("DISCORD_MEMBERS_INTENT", "false").lower() == "true"  # privileged; enables instant cache invalidation
+BOT_API_PORT = int(os.getenv("BOT_API_PORT", "3000"))  # internal API port (one per process when sharded)
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "10"))  # fallback poll; NOTIFY wakes the dispatcher sooner
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # done/failed events older than this are purged
+OUTBOX_PURGE_INTERVAL = 3600  # seconds between purges, run by the drain loop
+ITEM_INDEX_REFRESH_SECONDS = int(os.getenv("ITEM_INDEX_REFRESH_SECONDS", "300"))  # /buy autocomplete catch-up interval
+LEADERBOARD_CHANNEL_ID = int(os.getenv("LEADERBOARD_CHANNEL_ID") or 0)  # auto-updated leaderboard post (blank = none)
+LEADERBOARD_SIZE = max(1, min(int(os.getenv("LEADERBOARD_SIZE", "10")), 25))
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "false").lower() == "true"  # sync even if the command tree is unchanged
 
 # ─── GLOBALS ─────────────────────────────────────────────────
-cooldowns = {}
+internal_api = None   # aiohttp server for the admin portal, started once in on_ready
+STARTED_AT = time.monotonic()
 
 # ─── FORMAT PRICE ────────────────────────────────────────────
 def format_price(price):
@@ -73,58 +93,363 @@ def process_item_content(content, player_name):
     # Replace placeholder with actual player name
     return [cmd.replace("{player}", player_name) for cmd in commands]
 
+# ─── SHOP ITEM EMBED ─────────────────────────────────────────
+def build_shop_item_embed(item):
+    embed = discord.Embed(
+        title=item["name"],
+        description=item.get("description", "No description."),
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Price", value=format_price(item["price"]), inline=True)
+    embed.add_field(name="Category", value=item["category"], inline=True)
+
+    if item.get("image_url"):
+        embed.set_image(url=item["image_url"])
+    if item.get("content"):
+        embed.add_field(name="Spawn Commands", value="\n".join(process_item_content(item["content"], "{player}")), inline=False)
+    return embed
+
+def build_packed_item_embed(item):
+    """Compact per-item embed for packed messages (Discord caps a message at 6000 embed characters)."""
+    embed = discord.Embed(
+        title=f"{item['name']} — {format_price(item['price'])}",
+        description=item.get("description") or None,
+        color=discord.Color.green()
+    )
+    if item.get("image_url"):
+        embed.set_thumbnail(url=item["image_url"])
+    return embed
+
+def build_shop_messages(bot, items):
+    """
+    Group shop items into the messages that represent them in the shop channel.
+    Each entry is {"items", "content", "embeds", "view"}: one per item for SHOP_LAYOUT=item,
+    or per category with up to SHOP_PACK_SIZE embeds and buy buttons for SHOP_LAYOUT=packed.
+    """
+    if SHOP_LAYOUT != "packed":
+        return [
+            {"items": [item], "content": None, "embeds": [build_shop_item_embed(item)], "view": ShopItemView(bot, item["name"])}
+            for item in items
+        ]
+
+    by_category = {}
+    for item in sorted(items, key=lambda i: ((i.get("category") or "Misc").lower(), i["name"].lower())):
+        by_category.setdefault(item.get("category") or "Misc", []).append(item)
+
+    messages = []
+    for category, category_items in by_category.items():
+        chunk, chars = [], 0
+        chunks = []
+        for item in category_items:
+            embed = build_packed_item_embed(item)
+            if chunk and (len(chunk) >= SHOP_PACK_SIZE or chars + len(embed) > 5500):
+                chunks.append(chunk)
+                chunk, chars = [], 0
+            chunk.append((item, embed))
+            chars += len(embed)
+        if chunk:
+            chunks.append(chunk)
+
+        for index, chunk in enumerate(chunks):
+            messages.append({
+                "items": [item for item, _ in chunk],
+                "content": f"🛒 **{category}**" if index == 0 else None,
+                "embeds": [embed for _, embed in chunk],
+                "view": PackedShopView(bot, [item for item, _ in chunk]),
+            })
+    return messages
+
+def render_hash(message):
+    """Stable hash of what a message would look like, so unchanged posts can be skipped."""
+    embeds = [embed.to_dict() for embed in message["embeds"]]
+    rendered = {"components": message["view"].to_components()}
+    if len(embeds) == 1 and not message.get("content"):
+        rendered["embed"] = embeds[0]  # same shape as single-item posts made before packing existed
+    else:
+        rendered["content"] = message.get("content")
+        rendered["embeds"] = embeds
+    return hashlib.sha256(json.dumps(rendered, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# ─── LEADERBOARD EMBED ───────────────────────────────────────
+LEADERBOARD_TITLES = {"wealth": "💰 Richest Players", "spenders": "🛒 Top Spenders"}
+RANK_MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+def build_leaderboard_embed(board, rows):
+    lines = []
+    for row in rows:
+        rank = RANK_MEDALS.get(row["rank"], f"`#{row['rank']}`")
+        who = f"**{row['name']}**" if row.get("name") else f"<@{row['discord_id']}>"
+        lines.append(f"{rank} {who} — {format_price(row['value'])}")
+    embed = discord.Embed(
+        title=LEADERBOARD_TITLES.get(board, board),
+        description="\n".join(lines) or "No players ranked yet.",
+        color=discord.Color.gold()
+    )
+    if rows:
+        embed.set_footer(text=f"Updated {rows[0]['refreshed_at']:%Y-%m-%d %H:%M} · refreshes every {max(1, LEADERBOARD_REFRESH_SECONDS // 60)} min")
+    return embed
+
 # ─── DISCORD VIEW FOR BUTTON ────────────────────────────────
+# Buttons are DynamicItems: registered once at startup with bot.add_dynamic_items, they are
+# rebuilt from their custom_id on click, so messages posted before a restart keep working.
 class ShopItemView(View):
     def __init__(self, bot, item_name):
         super().__init__(timeout=None)
-        self.add_item(BuyButton(bot, item_name))
+        self.add_item(BuyButton(item_name))
 
-class BuyButton(Button):
-    def __init__(self, bot, item_name):
-        super().__init__(label="🛒 Buy", style=ButtonStyle.green, custom_id=f"buy_item_by_name:{item_name}")
-        self.bot = bot
+class BuyButton(DynamicItem[Button], template=r"buy_item_by_name:(?P<name>.+)"):
+    def __init__(self, item_name):
+        super().__init__(Button(label="🛒 Buy", style=ButtonStyle.green, custom_id=f"buy_item_by_name:{item_name}"))
         self.item_name = item_name
 
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["name"])
+
+    @instrumentation.interaction("buy_button")
     async def callback(self, interaction: Interaction):
-        cog = self.bot.get_cog("ScumBot")
+        cog = interaction.client.get_cog("ScumBot")
         if cog:
             await cog.buy_from_button(interaction, self.item_name)
 
+# Packed layout: several items per message, buttons resolve the item by id
+class PackedShopView(View):
+    def __init__(self, bot, items):
+        super().__init__(timeout=None)
+        for item in items:
+            self.add_item(BuyItemButton(item["id"], item["name"]))
+
+class BuyItemButton(DynamicItem[Button], template=r"buy_item:(?P<id>[0-9]+)"):
+    def __init__(self, item_id, item_name=None):
+        label = f"🛒 {item_name}" if item_name else "🛒 Buy"
+        super().__init__(Button(
+            label=label if len(label) <= 80 else label[:79] + "…",
+            style=ButtonStyle.green,
+            custom_id=f"buy_item:{item_id}"
+        ))
+        self.item_id = item_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["id"]))
+
+    @instrumentation.interaction("buy_button")
+    async def callback(self, interaction: Interaction):
+        cog = interaction.client.get_cog("ScumBot")
+        if cog:
+            await cog.buy_from_button(interaction, item_id=self.item_id)
+
 # ─── DISCORD COG ─────────────────────────────────────────────
 class ScumBot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.publisher = Publisher()
+        self.item_index = ItemIndex()  # serves /buy autocomplete
+        self.rate_limiter = RateLimiter()  # per-user buy/taxi/transfer limits
+        self.admin_cache = {}  # (guild id, user id) -> (is admin, expires at); fetch_member fallback only
+        self.leaderboards = None  # board -> ranked rows from the latest snapshot
+        self.leaderboards_loaded = 0.0
+        self.outbox_lock = asyncio.Lock()
+        self.outbox_purged = 0.0  # monotonic time of the last bot_outbox purge
         self.bot.tree.add_command(self.send_bank_buttons, guild=discord.Object(id=GUILD_ID)) # Register bank buttons command for the specific guild
         self.bot.tree.add_command(self.send_taxis, guild=discord.Object(id=GUILD_ID)) # Register taxi command for the specific guild
 
+    async def cog_load(self):
+        self.refresh_item_index.change_interval(seconds=ITEM_INDEX_REFRESH_SECONDS)
+        self.refresh_item_index.start()
+
+    async def cog_unload(self):
+        self.refresh_item_index.cancel()
+        self.drain_outbox.cancel()
+        self.refresh_leaderboards.cancel()
+
+    # Catalog edits made outside the bot (web admin, imports) reach the index here;
+    # sync() only touches items that changed.
+    @tasks.loop(seconds=300)
+    async def refresh_item_index(self):
+        try:
+            changed, removed = self.item_index.sync(db.get_shop_items())
+            if changed or removed:
+                print(f"🔎 Item index updated: {changed} changed, {removed} removed ({len(self.item_index)} items)")
+        except Exception as e:
+            print(f"⚠️ Item index refresh failed: {e}")
+
+    # ─── OUTBOX DISPATCHER ───────────────────────────────────
+    # Catalog changes from the web admin land in bot_outbox in the same transaction as the
+    # change. Only the process owning the home guild drains it (started in on_ready).
+    @tasks.loop(seconds=10)
+    async def drain_outbox(self):
+        # An unhandled error would stop the loop for good, so log and retry on the next poll
+        try:
+            await self.process_outbox()
+        except Exception as e:
+            print(f"⚠️ Outbox drain failed: {e}")
+        if time.monotonic() - self.outbox_purged > OUTBOX_PURGE_INTERVAL:
+            self.outbox_purged = time.monotonic()
+            try:
+                purged = db.purge_outbox(OUTBOX_RETENTION_DAYS)
+                if purged:
+                    print(f"🧹 Outbox: purged {purged} processed event(s)")
+            except Exception as e:
+                print(f"⚠️ Outbox purge failed: {e}")
+
+    async def process_outbox(self):
+        if self.outbox_lock.locked():
+            return  # the running drain picks up anything new on its next claim
+        async with self.outbox_lock:
+            while True:
+                events = db.claim_outbox_events(OUTBOX_BATCH_SIZE)
+                if not events:
+                    return
+                ids = [event["id"] for event in events]
+                try:
+                    await self.apply_outbox_events(events)
+                except Exception as e:
+                    db.fail_outbox_events(ids, e, OUTBOX_MAX_ATTEMPTS)
+                    print(f"❌ Outbox batch of {len(events)} failed, will retry: {e}")
+                    return
+                db.complete_outbox_events(ids)
+                print(f"📬 Outbox: applied {len(events)} catalog event(s)")
+
+    async def apply_outbox_events(self, events):
+        """
+        Every event (create, update, price change, delete, import) is applied by reconciling
+        the shop channel against the catalog: unchanged posts cost nothing and replaying a
+        batch is harmless, so a whole batch collapses into one idempotent sync.
+        """
+        self.item_index.sync(db.get_shop_items())
+        stats = await self.sync_shop_channel()
+        if stats is None:
+            raise RuntimeError("shop channel unavailable")
+        if stats["failed"]:
+            raise RuntimeError(f"{stats['failed']} Discord call(s) failed")
+
+    # ─── LEADERBOARDS ────────────────────────────────────────
+    # Rankings are never computed per request: the owning process rebuilds the top-N
+    # snapshots every LEADERBOARD_REFRESH_SECONDS (started in on_ready) and /leaderboard
+    # answers from the copy kept here.
+    @tasks.loop(seconds=300)
+    async def refresh_leaderboards(self):
+        try:
+            self.leaderboards = db.refresh_leaderboards(LEADERBOARD_SIZE)
+            self.leaderboards_loaded = time.monotonic()
+        except Exception as e:
+            print(f"⚠️ Leaderboard refresh failed: {e}")
+            return
+        try:
+            await self.update_leaderboard_post()
+        except Exception as e:
+            print(f"⚠️ Leaderboard post update failed: {e}")
+
+    def get_leaderboards(self):
+        if self.leaderboards is None or time.monotonic() - self.leaderboards_loaded > LEADERBOARD_REFRESH_SECONDS:
+            self.leaderboards = db.get_leaderboards()
+            self.leaderboards_loaded = time.monotonic()
+        return self.leaderboards
+
+    async def update_leaderboard_post(self):
+        """Edit the one leaderboard message in place (id kept in settings); skipped when nothing changed."""
+        channel = self.bot.get_channel(LEADERBOARD_CHANNEL_ID) if LEADERBOARD_CHANNEL_ID else None
+        if not channel:
+            return
+
+        boards = self.get_leaderboards()
+        embeds = [build_leaderboard_embed(board, boards.get(board, [])) for board in db.LEADERBOARDS]
+        # Rankings only, so a new refresh time alone doesn't cost an edit
+        ranked = {board: [(row["rank"], row["player_id"], row["name"], str(row["value"])) for row in rows]
+                  for board, rows in boards.items()}
+        digest = hashlib.sha256(json.dumps(ranked, sort_keys=True).encode("utf-8")).hexdigest()
+
+        message = None
+        message_id = db.get_setting("leaderboard_message_id")
+        if message_id:
+            if db.get_setting("leaderboard_digest") == digest:
+                return
+            try:
+                message = await channel.get_partial_message(int(message_id)).edit(content=None, embeds=embeds)
+            except discord.NotFound:
+                message = None
+
+        if message is None:
+            message = await channel.send(embeds=embeds)
+            db.set_setting("leaderboard_message_id", message.id)
+            print(f"🏆 Posted leaderboard message: {message.id}")
+        db.set_setting("leaderboard_digest", digest)
+
+    @instrumentation.timed("step", "log_command")
     async def log_command(self, interaction, message):
         if LOG_CHANNEL_ID:
             channel = self.bot.get_channel(LOG_CHANNEL_ID)
             if channel:
                 await channel.send(f"📜 {interaction.user} used `{interaction.command.name}`: {message}")
 
-    def queue_spawn_command(self, item_name, player_name, quantity):
-        with open(COMMAND_RELAY_FILE, "a") as f:
-            for _ in range(quantity):
-                f.write(f"#spawnitem {item_name} {player_name}\n")
-
-    def is_on_cooldown(self, user_id):
-        now = time.time()
-        return user_id in cooldowns and now - cooldowns[user_id] < COOLDOWN_SECONDS
+    async def check_rate_limit(self, interaction, action):
+        """Consume one `action` token for the user; replies and returns False when limited. Admins are exempt.
 
-    def set_cooldown(self, user_id):
-        cooldowns[user_id] = time.time()
+        Call it once the request has passed validation, right before it changes anything, so a
+        mistyped item or short balance doesn't cost the user a token.
+        """
+        if await self.is_admin(interaction):
+            return True
+        retry_after = self.rate_limiter.hit(action, interaction.user.id)
+        if not retry_after:
+            return True
+        await interaction.response.send_message(
+            f"⏳ Please wait {int(retry_after) + 1}s before trying again.", ephemeral=True
+        )
+        return False
 
+    # ─── ADMIN ROLE CACHE ────────────────────────────────────
+    # Guild interactions already carry the member's roles, so the check is normally local.
+    # Results are cached per user; member/role update events invalidate entries right away
+    # (member updates need DISCORD_MEMBERS_INTENT), and ADMIN_CACHE_TTL bounds staleness otherwise.
+    @instrumentation.timed("step", "is_admin")
     async def is_admin(self, interaction):
         guild = interaction.guild
         if not guild:
             return False
-        member = await guild.fetch_member(interaction.user.id)
+        # Guild interactions carry the Member with its current roles: authoritative and free
+        member = interaction.user if isinstance(interaction.user, discord.Member) else guild.get_member(interaction.user.id)
+        if member is not None:
+            return self.has_admin_role(member)
+
+        key = (guild.id, interaction.user.id)
+        now = time.monotonic()
+        cached = self.admin_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        result = self.has_admin_role(await guild.fetch_member(interaction.user.id))
+        self.admin_cache[key] = (result, now + ADMIN_CACHE_TTL)
+        if len(self.admin_cache) > 10000:
+            self.admin_cache = {k: v for k, v in self.admin_cache.items() if v[1] > now}
+        return result
+
+    @staticmethod
+    def has_admin_role(member):
         return any(role.name == ADMIN_ROLE_NAME for role in member.roles)
 
-    async def buy_from_button(self, interaction: discord.Interaction, item_name: str):
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.admin_cache.pop((after.guild.id, after.id), None)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.admin_cache.pop((member.guild.id, member.id), None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        # A rename can grant or revoke admin for everyone holding the role
+        if before.name != after.name:
+            self.admin_cache.clear()
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.admin_cache.clear()
+
+    async def buy_from_button(self, interaction: discord.Interaction, item_name: str = None, item_id: int = None):
         player_id = db.get_or_create_player(interaction.user.id, "", interaction.user.name)
-        item = db.get_shop_item_by_name(item_name)
+        item = db.get_shop_item_by_id(item_id) if item_id is not None else db.get_shop_item_by_name(item_name)
 
         if not item:
             await interaction.response.send_message("❌ Item not found.", ephemeral=True)
@@ -139,6 +464,8 @@ class ScumBot(commands.Cog):
                 f"❌ You don’t have enough funds. Cost: {total_cost}, Balance: {balance}", ephemeral=True
             )
             return
+        if not await self.check_rate_limit(interaction, "buy"):
+            return
 
         # Deduct and save order
         db.update_balance(player_id, -total_cost)
@@ -187,60 +514,207 @@ class ScumBot(commands.Cog):
             text_block = "\n".join(commands_list)
             await channel.send(f"📦 New Delivery:\n```{text_block}```")
 
+    @instrumentation.timed("step", "post_shop_item")
     async def post_shop_item(self, item):
+        await self.post_shop_items([item])
+
+    async def post_shop_items(self, items):
+        """Post new catalog items in one publisher batch. Returns the number posted, or None without a channel."""
         channel = self.bot.get_channel(SHOP_LOG_CHANNEL_ID)
         if not channel:
             print("❌ Could not find shop channel.")
-            return
+            return None
 
-        embed = discord.Embed(
-            title=item["name"],
-            description=item.get("description", "No description."),
-            color=discord.Color.green()
-        )
-        embed.add_field(name="Price", value=format_price(item["price"]), inline=True)
-        embed.add_field(name="Category", value=item["category"], inline=True)
+        for item in items:
+            if item.get("id") is not None:
+                self.item_index.upsert(item)
+
+        if SHOP_LAYOUT == "packed":
+            # New items change their category's packs, so let the reconciler place them
+            stats = await self.sync_shop_channel()
+            return stats and stats["posted"] + stats["edited"]
+
+        jobs = [
+            PublishJob(
+                ("send", channel.id),
+                self._send_shop_message(channel, shop_message, render_hash(shop_message)),
+                ordered=True,
+                label=f"post {shop_message['items'][0]['name']}",
+            )
+            for shop_message in build_shop_messages(self.bot, items)
+        ]
+        await self.publisher.run(jobs)
+        return sum(1 for job in jobs if not job.error)
+
+    async def sync_shop_channel(self, progress=None):
+        """
+        Reconcile the shop channel with the catalog using the stored message_id/embed_hash:
+        unchanged posts are left alone, changed ones are edited in place, missing ones are
+        posted and bot messages no item points at are deleted. API calls go through the
+        rate-limit-aware publisher; progress(done, total) is reported as they finish.
+        Returns a dict of counts, or None if the channel is unavailable.
+        """
+        channel = self.bot.get_channel(SHOP_LOG_CHANNEL_ID)
+        if not channel:
+            print("❌ Could not find shop channel.")
+            return None
+
+        # One history pass (100 messages per API call) tells us which of our posts still exist
+        existing = {}
+        async for msg in channel.history(limit=None):
+            if msg.author.id == self.bot.user.id and not msg.pinned:
+                existing[msg.id] = msg
+
+        stats = {"unchanged": 0, "edited": 0, "posted": 0, "deleted": 0}
+        keep = set()
+        jobs = []
+        catalog = db.get_shop_items_for_sync()
+        self.item_index.sync(catalog)
+        for shop_message in build_shop_messages(self.bot, catalog):
+            items = shop_message["items"]
+            digest = render_hash(shop_message)
+            label = ", ".join(item["name"] for item in items[:3])
+
+            # The message the items currently point at (packed items share one)
+            candidates = [
+                int(item["message_id"]) for item in items
+                if item.get("message_id") and str(item.get("channel_id")) == str(channel.id)
+                and int(item["message_id"]) in existing and int(item["message_id"]) not in keep
+            ]
+            msg = existing[max(set(candidates), key=candidates.count)] if candidates else None
+
+            if msg and all(item.get("embed_hash") == digest and str(item.get("message_id")) == str(msg.id) for item in items):
+                # No API call: the buttons are dynamic items and already handled
+                keep.add(msg.id)
+                stats["unchanged"] += 1
+                continue
+
+            if msg:
+                keep.add(msg.id)
+                stats["edited"] += 1
+                jobs.append(PublishJob(("edit", channel.id), self._edit_shop_message(msg, shop_message, digest),
+                                       label=f"edit {label}"))
+            else:
+                stats["posted"] += 1
+                jobs.append(PublishJob(("send", channel.id), self._send_shop_message(channel, shop_message, digest),
+                                       ordered=True, label=f"post {label}"))
 
-        if item.get("image_url"):
-            embed.set_image(url=item["image_url"])
-        if item.get("content"):
-            embed.add_field(name="Spawn Commands", value="\n".join(process_item_content(item["content"], "{player}")), inline=False)
+        orphans = [msg for msg_id, msg in existing.items() if msg_id not in keep]
+        jobs.extend(self._delete_jobs(channel, orphans))
+        stats["deleted"] = len(orphans)
 
-        view = ShopItemView(self.bot, item["name"])
-        message = await channel.send(embed=embed, view=view)
-        db.update_shop_item_message_info(item["id"], str(message.id), str(channel.id))
+        jobs = await self.publisher.run(jobs, progress)
+        stats["failed"] = sum(1 for job in jobs if job.error)
+
+        print(f"✅ Shop channel synced: {stats}")
+        return stats
+
+    def _send_shop_message(self, channel, shop_message, digest):
+        async def send():
+            message = await channel.send(
+                content=shop_message["content"], embeds=shop_message["embeds"], view=shop_message["view"]
+            )
+            db.update_shop_items_message_info(
+                [item["id"] for item in shop_message["items"]], str(message.id), str(channel.id), digest
+            )
+            return message
+        return send
+
+    def _edit_shop_message(self, msg, shop_message, digest):
+        async def edit():
+            await msg.edit(content=shop_message["content"], embeds=shop_message["embeds"], view=shop_message["view"])
+            db.update_shop_items_message_info(
+                [item["id"] for item in shop_message["items"]], str(msg.id), str(msg.channel.id), digest
+            )
+            return msg
+        return edit
+
+    def _delete_jobs(self, channel, messages):
+        """Bulk-delete (100 per call) where Discord allows it, one by one otherwise."""
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=14)
+        recent = [m for m in messages if m.created_at > cutoff]
+        older = [m for m in messages if m.created_at <= cutoff]
+        jobs = []
+        for i in range(0, len(recent), 100):
+            chunk = recent[i:i + 100]
+            if len(chunk) == 1:
+                older.extend(chunk)
+                continue
+            jobs.append(PublishJob(("bulk_delete", channel.id), self._bulk_delete(channel, chunk), label="bulk delete"))
+        for msg in older:
+            jobs.append(PublishJob(("delete", channel.id), self._delete_one(msg), label="delete"))
+        return jobs
+
+    def _bulk_delete(self, channel, chunk):
+        async def delete():
+            try:
+                await channel.delete_messages(chunk)
+            except discord.NotFound:
+                # Someone removed one of them already; fall back to individual deletes
+                for msg in chunk:
+                    await self._delete_one(msg)()
+        return delete
+
+    def _delete_one(self, msg):
+        async def delete():
+            try:
+                await msg.delete()
+            except discord.NotFound:
+                pass
+        return delete
+
+    async def purge_and_post_taxis(self, progress=None):
+        """Replace the taxi channel's (non-pinned) posts with one post per taxi."""
+        channel = self.bot.get_channel(TAXI_CHANNEL_ID) if TAXI_CHANNEL_ID else None
+        if not channel:
+            print("❌ Taxi channel not found.")
+            return None
+
+        await channel.purge(limit=None, check=lambda msg: not msg.pinned)
+
+        with db.get_connection() as conn:
+            taxis = db.get_all_taxis(conn)
+
+        jobs = [
+            PublishJob(("send", channel.id), (lambda taxi=taxi: self.post_taxi(taxi)), ordered=True, label=f"taxi {taxi['name']}")
+            for taxi in taxis
+        ]
+        jobs = await self.publisher.run(jobs, progress)
+        return sum(1 for job in jobs if not job.error)
 
     @app_commands.command(name="register", description="Register your SCUM username")
+    @instrumentation.interaction("register")
     async def register(self, interaction: Interaction, scum_username: str):
         db.get_or_create_player(interaction.user.id, scum_username, interaction.user.name)
         await interaction.response.send_message(f"✅ Registered as `{scum_username}`.", ephemeral=True)
         await self.log_command(interaction, f"registered as {scum_username}")
 
     @app_commands.command(name="buy", description="Buy an item from the shop")
-    @app_commands.describe(item_name="The exact name of the item")
+    @app_commands.describe(item_name="The item to buy (start typing for suggestions)")
+    @instrumentation.interaction("buy")
     async def buy(self, interaction: discord.Interaction, item_name: str, quantity: int = 1):
         if quantity < 1:
             await interaction.response.send_message("❌ Quantity must be at least 1.", ephemeral=True)
             return
-        if not await self.is_admin(interaction) and self.is_on_cooldown(interaction.user.id):
-            await interaction.response.send_message("⏳ Please wait before using this command again.", ephemeral=True)
-            return
 
         player_id = db.get_or_create_player(interaction.user.id, "", interaction.user.name)
         item = db.get_shop_item_by_name(item_name)
 
         if not item:
-            await interaction.response.send_message("❌ Item not found.", ephemeral=True)
+            suggestions = [i["name"] for i in self.item_index.search(item_name, limit=3)]
+            hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+            await interaction.response.send_message(f"❌ Item not found.{hint}", ephemeral=True)
             return
 
         total = item["price"] * quantity
         if db.get_balance(player_id) < total:
             await interaction.response.send_message(f"❌ Not enough funds. Total cost is {format_price(total)}.", ephemeral=True)
             return
+        if not await self.check_rate_limit(interaction, "buy"):
+            return
 
         db.update_balance(player_id, -total)
         db.save_order_to_db(player_id, item["id"], quantity)
-        self.set_cooldown(interaction.user.id)
 
         await interaction.response.send_message(
             f"✅ Purchased {quantity}x {item['name']} for {format_price(total)}.",
@@ -253,19 +727,48 @@ class ScumBot(commands.Cog):
                 f"📦 {interaction.user.display_name} bought {quantity}x {item['name']} for {format_price(total)}"
             )
 
-    @app_commands.command(name="send_shop_items", description="Post all shop items to the shop channel (admin only)")
+    @buy.autocomplete("item_name")
+    async def buy_item_name_autocomplete(self, interaction: discord.Interaction, current: str):
+        choices = []
+        for item in self.item_index.search(current, limit=25):
+            label = f"{item['name']} — {format_price(item['price'])} ({item['category'] or 'Misc'})"
+            choices.append(app_commands.Choice(name=label[:100], value=item["name"][:100]))
+        return choices
+
+    @app_commands.command(name="leaderboard", description="Show the richest players and top spenders")
+    @app_commands.describe(board="Which ranking to show (default: both)")
+    @app_commands.choices(board=[
+        app_commands.Choice(name="Richest players", value="wealth"),
+        app_commands.Choice(name="Top spenders", value="spenders"),
+    ])
+    @instrumentation.interaction("leaderboard")
+    async def leaderboard(self, interaction: Interaction, board: app_commands.Choice[str] = None):
+        boards = self.get_leaderboards()
+        names = [board.value] if board else list(db.LEADERBOARDS)
+        embeds = [build_leaderboard_embed(name, boards.get(name, [])) for name in names]
+        await interaction.response.send_message(embeds=embeds, ephemeral=True)
+
+    @app_commands.command(name="send_shop_items", description="Sync all shop items to the shop channel (admin only)")
+    @instrumentation.interaction("send_shop_items")
     async def send_shop_items(self, interaction: Interaction):
         if not await self.is_admin(interaction):
             await interaction.response.send_message("❌ No permission.", ephemeral=True)
             return
 
-        items = db.get_shop_items()
-        for item in items:
-            await self.post_shop_item(item)
+        # Answer within Discord's 3 s window, then report progress on the deferred response
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        stats = await self.sync_shop_channel(progress=InteractionProgress(interaction, "Syncing shop"))
+        if stats is None:
+            await interaction.edit_original_response(content="❌ Could not find shop channel.")
+            return
 
-        await interaction.response.send_message("✅ Posted all items.", ephemeral=True)
+        await interaction.edit_original_response(
+            content=f"✅ Shop synced — {stats['posted']} posted, {stats['edited']} updated, "
+                    f"{stats['deleted']} removed, {stats['unchanged']} unchanged, {stats['failed']} failed."
+        )
 
     @app_commands.command(name="send_bank_buttons", description="Post bank UI with balance, transfer, and history")
+    @instrumentation.interaction("send_bank_buttons")
     async def send_bank_buttons(self, interaction: discord.Interaction):
         if not await self.is_admin(interaction):
             await interaction.response.send_message("❌ Admin only.", ephemeral=True)
@@ -279,14 +782,15 @@ class ScumBot(commands.Cog):
         print("✅ Sent bank message")
 
         # ─── TAXI: post a single taxi to the taxi channel ───────
+    @instrumentation.timed("step", "post_taxi")
     async def post_taxi(self, taxi):
         if not TAXI_CHANNEL_ID:
             print("❌ TAXI_CHANNEL_ID not set")
-            return
+            return None
         channel = self.bot.get_channel(TAXI_CHANNEL_ID)
         if not channel:
             print("❌ Taxi channel not found")
-            return
+            return None
 
         price_display = format_price(taxi["price"])
         # coordinates is JSONB in DB; we just show a count to avoid clutter
@@ -304,10 +808,11 @@ class ScumBot(commands.Cog):
             color=discord.Color.blurple()
         )
         view = TaxiView(self.bot, taxi["id"], taxi["name"], int(float(taxi["price"])))
-        await channel.send(embed=embed, view=view)
+        return await channel.send(embed=embed, view=view)
 
     # ─── TAXI: admin command to (re)post all taxis ──────────
     @app_commands.command(name="send_taxis", description="Post all taxis to the taxi channel (admin only)")
+    @instrumentation.interaction("send_taxis")
     async def send_taxis(self, interaction: Interaction):
         if not await self.is_admin(interaction):
             await interaction.response.send_message("❌ No permission.", ephemeral=True)
@@ -325,16 +830,19 @@ class ScumBot(commands.Cog):
             await interaction.response.send_message("ℹ️ No taxis found to post.", ephemeral=True)
             return
 
-        posted = 0
-        for taxi in taxis:
-            await self.post_taxi(taxi)
-            posted += 1
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        jobs = [
+            PublishJob(("send", TAXI_CHANNEL_ID), (lambda taxi=taxi: self.post_taxi(taxi)), ordered=True, label=f"taxi {taxi['name']}")
+            for taxi in taxis
+        ]
+        jobs = await self.publisher.run(jobs, InteractionProgress(interaction, "Posting taxis"))
+        posted = sum(1 for job in jobs if not job.error)
 
-        await interaction.response.send_message(f"✅ Posted {posted} taxi(s).", ephemeral=True)
+        await interaction.edit_original_response(content=f"✅ Posted {posted} taxi(s).")
 
 
     # ─── TAXI: button handler (deduct & create taxi order) ──
-    async def order_taxi_from_button(self, interaction: discord.Interaction, taxi_id: int, taxi_name: str, price: int):
+    async def order_taxi_from_button(self, interaction: discord.Interaction, taxi_id: int):
         # Ensure player exists
         player_id = db.get_or_create_player(interaction.user.id, "", interaction.user.name)
 
@@ -353,6 +861,8 @@ class ScumBot(commands.Cog):
                 ephemeral=True
             )
             return
+        if not await self.check_rate_limit(interaction, "taxi"):
+            return
 
         # Deduct credits first (keeps pattern with your shop flow)
         db.update_balance(player_id, -real_price)
@@ -371,7 +881,7 @@ class ScumBot(commands.Cog):
             )
 
         await interaction.response.send_message(
-            f"✅ Taxi **{taxi_name}** ordered for {format_price(real_price)} credits! You’ll be teleported shortly.",
+            f"✅ Taxi **{taxi['name']}** ordered for {format_price(real_price)} credits! You’ll be teleported shortly.",
             ephemeral=True
         )
 
@@ -379,110 +889,182 @@ class ScumBot(commands.Cog):
 class TaxiView(View):
     def __init__(self, bot, taxi_id, taxi_name, price):
         super().__init__(timeout=None)
-        self.add_item(OrderTaxiButton(bot, taxi_id, taxi_name, price))
+        self.add_item(OrderTaxiButton(taxi_id, taxi_name))
 
-class OrderTaxiButton(Button):
-    def __init__(self, bot, taxi_id, taxi_name, price):
-        super().__init__(
-            label=f"🚖 Order {taxi_name}",
+class OrderTaxiButton(DynamicItem[Button], template=r"order_taxi:(?P<id>[0-9]+)"):
+    def __init__(self, taxi_id, taxi_name=None):
+        super().__init__(Button(
+            label=f"🚖 Order {taxi_name}" if taxi_name else "🚖 Order",
             style=ButtonStyle.blurple,
             custom_id=f"order_taxi:{taxi_id}"
-        )
-        self.bot = bot
+        ))
         self.taxi_id = taxi_id
-        self.taxi_name = taxi_name
-        self.price = int(float(price))
 
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match["id"]))
+
+    @instrumentation.interaction("taxi_button")
     async def callback(self, interaction: Interaction):
-        cog = self.bot.get_cog("ScumBot")
+        cog = interaction.client.get_cog("ScumBot")
         if cog:
-            await cog.order_taxi_from_button(interaction, self.taxi_id, self.taxi_name, self.price)
-
+            # Name and price are always read from the DB, the button only carries the id
+            await cog.order_taxi_from_button(interaction, self.taxi_id)
 
-# ─── FLASK APP (Internal API for Admin Portal) ──────────────
-flask_app = Flask(__name__)
 
-@flask_app.route('/api/post_item', methods=['POST'])
-def api_post_item():
-    data = request.json
-    if not data:
-        return jsonify({"error": "No JSON provided"}), 400
-
-    print("📨 Received /api/post_item:", data)
-    bot.loop.create_task(bot.get_cog("ScumBot").post_shop_item(data))
-    return jsonify({"status": "posted"}), 200
-
-@flask_app.route("/api/repost_taxis", methods=["POST"])
-def api_repost_taxis():
+# ─── INTERNAL API JOBS (see internal_api.py) ────────────────
+# Jobs only run in the process owning DISCORD_GUILD_ID; other shards forward them here.
+async def run_api_job(kind, payload):
+    if kind == "invalidate_player":  # web admin changed a player (db.PLAYER_NOTIFY_CHANNEL)
+        db.invalidate_player(payload)
+        return
     scum_cog = bot.get_cog("ScumBot")
     if not scum_cog:
-        return jsonify({"error": "ScumBot not ready"}), 500
+        print(f"⚠️ Dropping API job {kind}: ScumBot not ready")
+        return
+    if kind == "post_items":
+        posted = await scum_cog.post_shop_items(payload)
+        print(f"✅ Posted {posted} of {len(payload)} item(s) to Discord.")
+    elif kind == "post_item":  # forwarded by processes running an older version
+        await scum_cog.post_shop_item(payload)
+    elif kind == "outbox":
+        try:
+            await scum_cog.process_outbox()
+        except Exception as e:
+            print(f"⚠️ Outbox drain failed: {e}")  # the drain loop picks the events up again
+    elif kind == "sync_shop":
+        stats = await scum_cog.sync_shop_channel()
+        print(f"✅ Shop synced: {stats}")
+    elif kind == "repost_taxis":
+        posted = await scum_cog.purge_and_post_taxis()
+        if posted is not None:
+            print(f"✅ Reposted {posted} taxi(s) to Discord.")
+    else:
+        print(f"⚠️ Unknown API job: {kind}")
 
-    async def do_repost():
-        channel_id = int(os.getenv("TAXI_CHANNEL_ID", "1408626703206580246"))
-        channel = bot.get_channel(channel_id)
-        if not channel:
-            print("❌ Taxi channel not found.")
-            return
+# ─── COMMAND SYNC ────────────────────────────────────────────
+def command_tree_hash(tree, guild=None):
+    """Hash of the command payloads tree.sync(guild=guild) would upload (guild=None: global commands)."""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)), key=lambda c: c["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
 
-        # Purge existing (non-pinned) messages in taxi channel
-        def check(msg): return not msg.pinned
-        await channel.purge(limit=None, check=check)
+async def sync_commands_if_changed(tree, guild_id):
+    """
+    Sync the global commands (the cog's /register, /buy, /leaderboard) and the guild-only
+    admin commands, each only when it differs from its last successful sync (hashes kept in settings).
+    """
+    synced = False
+    for scope, guild in (("global", None), (str(guild_id), discord.Object(id=guild_id))):
+        digest = command_tree_hash(tree, guild)
+        setting = f"command_tree_hash:{scope}"
+        if not FORCE_COMMAND_SYNC and db.get_setting(setting) == digest:
+            continue
+        await tree.sync(guild=guild)
+        db.set_setting(setting, digest)
+        print(f"✅ Commands synced ({scope})")
+        synced = True
+    if not synced:
+        print("✅ Commands unchanged, sync skipped")
+    return synced
+
+# ─── STATUS MESSAGE ──────────────────────────────────────────
+async def update_status_message():
+    """
+    Edit the stored status message through a partial message: one API call, no channel
+    or message fetch. Only a first start without a stored id looks through the history.
+    """
+    status_channel = bot.get_partial_messageable(BOT_STATUS_CHANNEL_ID)
+    status_text = f"✅ **Bot is online** — Ready at {discord.utils.format_dt(discord.utils.utcnow(), style='F')}"
+    stored_id = status_message_id = db.get_setting("status_message_id")
+    if stored_id is None:
+        # Adopt the message posted before the id was stored
+        async for msg in status_channel.history(limit=10):
+            if msg.author.id == bot.user.id:
+                status_message_id = msg.id
+                break
 
-        # Get taxis from DB
-        with db.get_connection() as conn:
-            taxis = db.get_all_taxis(conn)
+    if status_message_id:
+        try:
+            message = await status_channel.get_partial_message(int(status_message_id)).edit(content=status_text)
+            print(f"✅ Updated existing status message: {message.id}")
+            if stored_id is None:
+                db.set_setting("status_message_id", message.id)
+            return
+        except discord.NotFound:
+            pass
+    message = await status_channel.send(status_text)
+    db.set_setting("status_message_id", message.id)
+    print(f"✅ Created new status message: {message.id}")
 
-        # Post each taxi (reuse same logic from your /send_taxis command)
-        for taxi in taxis:
-            await scum_cog.post_taxi_item(channel, taxi)
+# ─── BOT SETUP ───────────────────────────────────────────────
+# SHARD_COUNT=N runs this process as an AutoShardedBot over SHARD_IDS (see cluster.py)
+BotBase = commands.AutoShardedBot if cluster.SHARD_COUNT else commands.Bot
 
-        print("✅ Reposted taxis to Discord.")
 
-    bot.loop.create_task(do_repost())
-    return jsonify({"status": "reposted"}), 200
+class ScumDiscordBot(BotBase):
+    startup_done = False  # on_ready fires again after every reconnect; startup work runs once
 
+    async def setup_hook(self):
+        # Runs once per process, before the gateway connects (on_ready doesn't)
+        db.init()
+        print("✅ DB initialized")
+        await self.add_cog(ScumBot(self))
+        print("✅ Cog added")
 
-def run_flask():
-    print("🌐 Starting internal Flask API on port 3000")
-    flask_app.run(host='0.0.0.0', port=3000)
+        # Persistent components: buttons on existing messages keep working after a restart
+        self.add_dynamic_items(BuyButton, BuyItemButton, OrderTaxiButton)
+        self.add_view(BankView(self))
+        print("✅ Persistent buttons registered")
 
-# ─── BOT SETUP ───────────────────────────────────────────────
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="!", intents=intents)
+intents.members = MEMBERS_INTENT  # must also be enabled in the developer portal
+shard_options = {}
+if cluster.SHARD_COUNT:
+    shard_options = {"shard_count": cluster.SHARD_COUNT, "shard_ids": cluster.SHARD_IDS}
+bot = ScumDiscordBot(command_prefix="!", intents=intents, **shard_options)
 print(f"💡 Bot object created: {bot}")
 
 @bot.event
 async def on_ready():
-    print("🔧 on_ready started")
-    db.init()
-    print("✅ DB initialized")
+    if bot.startup_done:
+        print("🔁 Reconnected — startup already done")
+        return
+    bot.startup_done = True
+    print(f"🔧 on_ready started ({time.monotonic() - STARTED_AT:.1f}s after launch)")
+
+    # Every process serves the internal API; jobs reach the owner shard
+    global internal_api
+    if internal_api is None:
+        from internal_api import InternalAPI  # deferred: pulls in aiohttp.web
+        internal_api = InternalAPI(bot, run_api_job, GUILD_ID, BOT_API_PORT)
+        await internal_api.start()
+
+    # Every process drops players the web admin edited or deleted; only the owner runs API jobs
+    owner = cluster.owns_guild(GUILD_ID)
+    channels = [db.PLAYER_NOTIFY_CHANNEL] + ([cluster.API_CHANNEL] if owner else [])
+    cluster.JobListener(run_api_job, channels).start(bot.loop)
+
+    if not owner:
+        print(f"✅ Bot is ready (shards {cluster.SHARD_IDS}, home guild owned by shard "
+              f"{cluster.shard_for_guild(GUILD_ID)}; forwarding API jobs).")
+        return
 
-    await bot.add_cog(ScumBot(bot))
-    print("✅ Cog added")
+    scum_cog = bot.get_cog("ScumBot")
+    if not scum_cog.drain_outbox.is_running():
+        scum_cog.drain_outbox.change_interval(seconds=OUTBOX_POLL_SECONDS)
+        scum_cog.drain_outbox.start()
+    if not scum_cog.refresh_leaderboards.is_running():
+        scum_cog.refresh_leaderboards.change_interval(seconds=LEADERBOARD_REFRESH_SECONDS)
+        scum_cog.refresh_leaderboards.start()
 
     try:
-        guild = discord.Object(id=GUILD_ID)
-        await bot.tree.sync(guild=guild)
-        print("✅ Commands synced")
+        await sync_commands_if_changed(bot.tree, GUILD_ID)
     except Exception as e:
         print(f"❌ Error syncing commands: {e}")
 
-    # BOT STATUS MESSAGE
+    # BOT STATUS MESSAGE (id kept in Postgres so restarts and other shards edit the same message)
     try:
-        status_channel = await bot.fetch_channel(BOT_STATUS_CHANNEL_ID)
-        status_text = f"✅ **Bot is online** — Ready at {discord.utils.format_dt(discord.utils.utcnow(), style='F')}"
-        last_bot_message = None
-        async for msg in status_channel.history(limit=10):
-            if msg.author.id == bot.user.id:
-                last_bot_message = msg
-                break
-        if last_bot_message:
-            await last_bot_message.edit(content=status_text)
-            print(f"✅ Updated existing status message: {last_bot_message.id}")
-        else:
-            sent_msg = await status_channel.send(status_text)
-            print(f"✅ Created new status message: {sent_msg.id}")
+        await update_status_message()
     except Exception as e:
         print(f"❌ Failed to send bot status: {e}")
 
@@ -497,12 +1079,8 @@ async def on_ready():
                 return not msg.pinned
             await channel.purge(limit=None, check=check)
 
-        shop_channel = bot.get_channel(SHOP_LOG_CHANNEL_ID)
-        if shop_channel:
-            await purge_without_pins(shop_channel)
-            items = db.get_shop_items()
-            for item in items:
-                await scum_cog.post_shop_item(item)
+        # Shop is reconciled in place rather than purged: only changed items cost API calls
+        if await scum_cog.sync_shop_channel() is not None:
             print("✅ Shop items refreshed")
 
         bank_channel = bot.get_channel(BANK_CHANNEL_ID)
@@ -510,21 +1088,10 @@ async def on_ready():
             await purge_without_pins(bank_channel)
             await bank_channel.send("🏦 **Bank Actions:**", view=BankView(bot))
             print("✅ Bank buttons refreshed")
-        # inside: if auto_refresh: ...
-        taxi_channel = bot.get_channel(TAXI_CHANNEL_ID)
-        if taxi_channel and TAXI_CHANNEL_ID:
-            await purge_without_pins(taxi_channel)
-            scum_cog = bot.get_cog("ScumBot")
-            with db.get_connection() as conn:
-                taxis = db.get_all_taxis(conn)
-            for taxi in taxis:
-                await scum_cog.post_taxi(taxi)
+        if TAXI_CHANNEL_ID and await scum_cog.purge_and_post_taxis() is not None:
             print("✅ Taxis refreshed")
 
-    # Start Flask in background
-    threading.Thread(target=run_flask, daemon=True).start()
-
-    print("✅ Bot is ready.")
+    print(f"✅ Bot is ready ({time.monotonic() - STARTED_AT:.1f}s after launch).")
 
 # ─── RUN BOT ─────────────────────────────────────────────────
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+# publisher.py – rate-limit-aware concurrent publishing to Discord
+#
+# Bulk posts (shop sync, taxi posts, reposts) are queued as jobs keyed by route, e.g.
+# ("send", channel_id). Each route has its own token bucket sized to Discord's per-channel
+# limits, ordered routes (message creates) run FIFO so the channel keeps its order, and
+# different routes run concurrently up to PUBLISH_CONCURRENCY. 429s are retried with the
+# server-provided retry_after, or exponential backoff when none is given.
+
+import os
+import time
+import random
+import asyncio
+
+import discord
+
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "4"))
+PUBLISH_MAX_RETRIES = int(os.getenv("PUBLISH_MAX_RETRIES", "5"))
+# Discord allows roughly 5 message writes per 5 s per channel
+BUCKET_CAPACITY = int(os.getenv("PUBLISH_BUCKET_CAPACITY", "5"))
+BUCKET_PERIOD = float(os.getenv("PUBLISH_BUCKET_PERIOD", "5"))
+
+
+class RouteBucket:
+    """Token bucket for one route; a 429 blocks the whole bucket until retry_after passes."""
+
+    def __init__(self, capacity=BUCKET_CAPACITY, period=BUCKET_PERIOD):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class PublishJob:
+    def __init__(self, route, factory, ordered=False, label=None):
+        self.route = route        # e.g. ("send", channel.id)
+        self.factory = factory    # zero-arg callable returning a fresh coroutine per attempt
+        self.ordered = ordered    # FIFO within the route (message creates keep channel order)
+        self.label = label
+        self.result = None
+        self.error = None
+
+
+def _retry_after(error, attempt):
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        header = error.response.headers.get("Retry-After") if error.response is not None else None
+        if header:
+            try:
+                return float(header)
+            except ValueError:
+                pass
+        return min(30.0, (2 ** attempt) + random.random())
+    if isinstance(error, discord.HTTPException) and error.status >= 500:
+        return min(30.0, (2 ** attempt) + random.random())
+    return None
+
+
+class Publisher:
+    def __init__(self, concurrency=PUBLISH_CONCURRENCY, max_retries=PUBLISH_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.buckets = {}
+
+    def bucket(self, route):
+        if route not in self.buckets:
+            self.buckets[route] = RouteBucket()
+        return self.buckets[route]
+
+    async def _execute(self, job):
+        bucket = self.bucket(job.route)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                job.result = await job.factory()
+                return
+            except Exception as e:
+                wait = _retry_after(e, attempt)
+                if wait is None or attempt == self.max_retries:
+                    job.error = e
+                    print(f"❌ Publish failed ({job.label or job.route}): {e}")
+                    return
+                print(f"⏳ Rate limited on {job.route}, retrying in {wait:.1f}s")
+                bucket.block(wait)
+
+    async def run(self, jobs, progress=None):
+        """
+        Run jobs and return them with .result/.error filled in.
+        progress(done, total) is awaited after every finished job.
+        """
+        jobs = list(jobs)
+        total = len(jobs)
+        if not total:
+            return jobs
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done = 0
+        done_lock = asyncio.Lock()
+
+        # Ordered routes get one worker (FIFO); unordered routes may use every slot
+        queues = {}
+        for job in jobs:
+            queues.setdefault((job.route, job.ordered), []).append(job)
+
+        async def worker(pending):
+            nonlocal done
+            while pending:
+                job = pending.pop(0)
+                async with semaphore:
+                    await self._execute(job)
+                async with done_lock:
+                    done += 1
+                    if progress:
+                        try:
+                            await progress(done, total)
+                        except Exception as e:
+                            print(f"⚠️ Progress update failed: {e}")
+
+        workers = []
+        for (route, ordered), pending in queues.items():
+            count = 1 if ordered else min(len(pending), self.concurrency)
+            workers.extend(worker(pending) for _ in range(count))
+        await asyncio.gather(*workers)
+        return jobs
+
+
+class InteractionProgress:
+    """Progress callback that edits a deferred interaction response at most every `interval` seconds."""
+
+    def __init__(self, interaction, label, interval=2.0):
+        self.interaction = interaction
+        self.label = label
+        self.interval = interval
+        self.last_update = 0.0
+
+    async def __call__(self, done, total):
+        now = time.monotonic()
+        if done < total and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        await self.interaction.edit_original_response(content=f"⏳ {self.label}: {done}/{total}")
@@ -0,0 +1,115 @@
+# rate_limiter.py – token-bucket rate limiting per user and action
+#
+# Replaces the old module-level cooldowns dict. Each action (buy, taxi, transfer) has its
+# own policy "capacity/seconds": up to `capacity` uses in a burst, refilling at
+# capacity/seconds tokens per second. Buckets expire once they would be full again, so
+# idle users cost nothing.
+#
+# RATE_LIMIT_BACKEND=memory   buckets live in this process (bounded LRU, lost on restart)
+# RATE_LIMIT_BACKEND=postgres buckets live in the UNLOGGED rate_limits table, so limits
+#                             hold across restarts and several bot processes
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import db
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))  # memory backend bound
+PURGE_INTERVAL = 600  # seconds between sweeps of expired rows in the postgres backend
+
+
+class Policy:
+    def __init__(self, capacity, period):
+        self.capacity = max(1, int(capacity))
+        self.period = float(period)
+        self.rate = self.capacity / self.period  # tokens per second
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse "capacity/seconds", e.g. "3/60"."""
+        capacity, period = spec.split("/", 1)
+        return cls(int(capacity), float(period))
+
+    @property
+    def ttl(self):
+        # After this long an untouched bucket is full again, i.e. indistinguishable from no bucket
+        return self.period
+
+
+POLICIES = {
+    "buy": Policy.parse(os.getenv("RATE_LIMIT_BUY", "3/60")),
+    "taxi": Policy.parse(os.getenv("RATE_LIMIT_TAXI", "2/60")),
+    "transfer": Policy.parse(os.getenv("RATE_LIMIT_TRANSFER", "3/60")),
+}
+
+
+# ─── BACKENDS ────────────────────────────────────────────────
+class MemoryBackend:
+    """In-process buckets; least recently used keys are dropped past max_keys."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, updated, expires)
+        self.lock = threading.Lock()
+
+    def take(self, key, policy):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, expires = self.buckets.pop(key, (policy.capacity, now, now))
+            if expires < now:
+                tokens, updated = policy.capacity, now
+            tokens = min(policy.capacity, tokens + (now - updated) * policy.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + policy.ttl)
+            self._evict(now)
+        return 0.0 if allowed else (1 - tokens) / policy.rate
+
+    def _evict(self, now):
+        # Oldest-touched entries sit at the front, so stop at the first live one
+        while self.buckets:
+            key, (_, _, expires) = next(iter(self.buckets.items()))
+            if expires >= now and len(self.buckets) <= self.max_keys:
+                break
+            self.buckets.popitem(last=False)
+
+
+class PostgresBackend:
+    """Buckets in the UNLOGGED rate_limits table, updated with one atomic UPSERT per check."""
+
+    def __init__(self):
+        self.last_purge = time.monotonic()
+
+    def take(self, key, policy):
+        allowed, tokens = db.take_rate_limit_token(key, policy.capacity, policy.rate, policy.ttl)
+        now = time.monotonic()
+        if now - self.last_purge > PURGE_INTERVAL:
+            self.last_purge = now
+            try:
+                db.purge_expired_rate_limits()
+            except Exception as e:
+                print(f"⚠️ Rate limit purge failed: {e}")
+        return 0.0 if allowed else (1 - tokens) / policy.rate
+
+
+# ─── LIMITER ─────────────────────────────────────────────────
+class RateLimiter:
+    def __init__(self, backend=None, policies=None):
+        if backend is None:
+            backend = PostgresBackend() if RATE_LIMIT_BACKEND == "postgres" else MemoryBackend()
+        self.backend = backend
+        self.policies = policies or POLICIES
+
+    def hit(self, action, user_id):
+        """Consume one token for (action, user). Returns 0 if allowed, else seconds until the next token."""
+        policy = self.policies[action]
+        try:
+            return self.backend.take(f"{action}:{user_id}", policy)
+        except Exception as e:
+            # A broken shared backend shouldn't lock everyone out of the shop
+            print(f"⚠️ Rate limiter unavailable, allowing {action} for {user_id}: {e}")
+            return 0.0
@@ -19,9 +19,23 @@ CREATE TABLE IF NOT EXISTS shop_items (
     content TEXT DEFAULT '', -- Can hold plain text OR JSON
     image_url TEXT DEFAULT NULL,
     message_id TEXT DEFAULT NULL,
-    channel_id TEXT DEFAULT NULL
+    channel_id TEXT DEFAULT NULL,
+    embed_hash TEXT DEFAULT NULL  -- hash of the rendered embed, lets the bot skip unchanged posts
 );
 
+-- Shop item search: weighted full-text vector (name > category > description > commands) + trigram name index
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE shop_items ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce(content, '')), 'D')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_shop_items_search ON shop_items USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_shop_items_name_trgm ON shop_items USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_shop_items_category ON shop_items(category);
+
 -- Orders table
 CREATE TABLE IF NOT EXISTS orders (
     id SERIAL PRIMARY KEY,
@@ -29,10 +43,25 @@ CREATE TABLE IF NOT EXISTS orders (
     item_id INT NOT NULL REFERENCES shop_items(id) ON DELETE CASCADE,
     quantity INT NOT NULL DEFAULT 1,
     total_price NUMERIC(10, 2) NOT NULL DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status TEXT DEFAULT 'pending'   -- ✅ new column
+    "timestamp" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- name used by db.py, the delivery bot and the rollup trigger
+    status TEXT DEFAULT 'pending',  -- ✅ new column
+    delivered_at TIMESTAMP DEFAULT NULL  -- set by the delivery bot
 );
 
+-- Databases created from older versions of this file named the column created_at
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name='orders' AND column_name='created_at'
+    ) AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name='orders' AND column_name='timestamp'
+    ) THEN
+        ALTER TABLE orders RENAME COLUMN created_at TO "timestamp";
+    END IF;
+END$$;
+
 -- Auto calculate total_price when inserting orders (if not supplied)
 CREATE OR REPLACE FUNCTION set_total_price()
 RETURNS TRIGGER AS $$
@@ -57,3 +86,289 @@ CREATE INDEX IF NOT EXISTS idx_players_discord_id ON players(discord_id);
 CREATE INDEX IF NOT EXISTS idx_shop_items_name ON shop_items(name);
 CREATE INDEX IF NOT EXISTS idx_orders_player_id ON orders(player_id);
 CREATE INDEX IF NOT EXISTS idx_orders_item_id ON orders(item_id);
+
+-- Rate limit token buckets (UNLOGGED: cheap writes, contents may be lost on crash, which only resets limits)
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_expires_at ON rate_limits(expires_at);
+
+-- Shared bot state (status message id, etc.) so restarts and shards agree
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Outbox of catalog changes for the bot, written in the same transaction as the change
+CREATE TABLE IF NOT EXISTS bot_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    event TEXT NOT NULL,
+    item_id INT,
+    payload JSONB,
+    idempotency_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | processing | done | failed
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bot_outbox_pending_key ON bot_outbox(idempotency_key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_bot_outbox_due ON bot_outbox(status, available_at) WHERE status IN ('pending', 'processing');
+
+-- Per-table change counters (one bump per writing statement) for admin page ETags/caching
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, NOW())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = table_versions.version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_shop_items_version ON shop_items;
+CREATE TRIGGER trg_shop_items_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON shop_items
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- players is not counted: every purchase writes a balance, and one counter row bumped by
+-- each of those statements serialises concurrent purchases on it
+DROP TRIGGER IF EXISTS trg_players_version ON players;
+
+-- taxis is created by the bot on first start (db.init), which also installs this trigger
+DO $$
+BEGIN
+    IF to_regclass('taxis') IS NOT NULL THEN
+        DROP TRIGGER IF EXISTS trg_taxis_version ON taxis;
+        CREATE TRIGGER trg_taxis_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON taxis
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+    END IF;
+END $$;
+
+-- Sales analytics rollups, maintained per order/taxi ride by triggers. Failed and deleted
+-- orders don't count: a status change to 'failed' or a delete takes the order back out.
+-- Daily totals are summed from sales_daily_item on read; a single row per day would be
+-- updated by every purchase of the day. The bot's db.init() backfills them once from
+-- existing orders.
+DROP TABLE IF EXISTS sales_daily;
+CREATE TABLE IF NOT EXISTS sales_daily_item (
+    day DATE NOT NULL,
+    item_id INT NOT NULL,
+    item_name TEXT,
+    category TEXT,
+    orders INT NOT NULL DEFAULT 0,
+    quantity INT NOT NULL DEFAULT 0,
+    revenue NUMERIC NOT NULL DEFAULT 0,
+    unique_buyers INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, item_id)
+);
+CREATE TABLE IF NOT EXISTS taxi_daily (
+    day DATE NOT NULL,
+    taxi_id INT NOT NULL,
+    taxi_name TEXT,
+    rides INT NOT NULL DEFAULT 0,
+    revenue NUMERIC NOT NULL DEFAULT 0,
+    unique_riders INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, taxi_id)
+);
+-- Who already counted towards a day's unique buyers/riders
+CREATE TABLE IF NOT EXISTS sales_daily_buyers (day DATE, player_id INT, PRIMARY KEY (day, player_id));
+CREATE TABLE IF NOT EXISTS sales_daily_item_buyers (day DATE, item_id INT, player_id INT, PRIMARY KEY (day, item_id, player_id));
+CREATE TABLE IF NOT EXISTS taxi_daily_riders (day DATE, taxi_id INT, player_id INT, PRIMARY KEY (day, taxi_id, player_id));
+-- Lifetime spend per player, ranks the "top spenders" leaderboard
+CREATE TABLE IF NOT EXISTS player_spend (
+    player_id INT PRIMARY KEY REFERENCES players(id) ON DELETE CASCADE,
+    orders INT NOT NULL DEFAULT 0,
+    rides INT NOT NULL DEFAULT 0,
+    spent NUMERIC NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_player_spend_spent ON player_spend(spent DESC);
+
+CREATE OR REPLACE FUNCTION rollup_order() RETURNS TRIGGER AS $$
+DECLARE
+    o RECORD;
+    adding BOOLEAN;
+    d DATE;
+    buyer_delta INT := 0;
+BEGIN
+    -- Failed orders don't count: an insert or a status change out of 'failed' adds the order,
+    -- a delete or a status change to 'failed' takes it back out
+    IF TG_OP <> 'DELETE' AND NEW.status IS DISTINCT FROM 'failed'
+       AND (TG_OP = 'INSERT' OR OLD.status = 'failed') THEN
+        o := NEW;
+        adding := TRUE;
+    ELSIF TG_OP <> 'INSERT' AND OLD.status IS DISTINCT FROM 'failed'
+       AND (TG_OP = 'DELETE' OR NEW.status = 'failed') THEN
+        o := OLD;
+        adding := FALSE;
+    ELSE
+        RETURN NULL;
+    END IF;
+    d := COALESCE(o.timestamp, NOW())::date;
+
+    IF adding THEN
+        INSERT INTO sales_daily_buyers VALUES (d, o.player_id) ON CONFLICT DO NOTHING;
+        INSERT INTO sales_daily_item_buyers VALUES (d, o.item_id, o.player_id) ON CONFLICT DO NOTHING;
+        IF FOUND THEN buyer_delta := 1; END IF;
+
+        INSERT INTO sales_daily_item (day, item_id, item_name, category, orders, quantity, revenue, unique_buyers)
+        SELECT d, o.item_id, si.name, COALESCE(si.category, 'Misc'), 1, o.quantity, COALESCE(o.total_price, 0), buyer_delta
+        FROM (SELECT 1) AS one LEFT JOIN shop_items si ON si.id = o.item_id
+        ON CONFLICT (day, item_id) DO UPDATE SET
+            item_name = COALESCE(EXCLUDED.item_name, sales_daily_item.item_name),
+            category = COALESCE(EXCLUDED.category, sales_daily_item.category),
+            orders = sales_daily_item.orders + 1,
+            quantity = sales_daily_item.quantity + EXCLUDED.quantity,
+            revenue = sales_daily_item.revenue + EXCLUDED.revenue,
+            unique_buyers = sales_daily_item.unique_buyers + EXCLUDED.unique_buyers;
+
+        INSERT INTO player_spend (player_id, orders, spent)
+        VALUES (o.player_id, 1, COALESCE(o.total_price, 0))
+        ON CONFLICT (player_id) DO UPDATE SET
+            orders = player_spend.orders + 1,
+            spent = player_spend.spent + EXCLUDED.spent;
+    ELSE
+        -- A buyer stops counting for the day once none of their other orders that day count.
+        -- Only UPDATEs here: a player delete cascades to player_spend and orders alike.
+        IF NOT EXISTS (
+            SELECT 1 FROM orders
+            WHERE player_id = o.player_id AND id <> o.id AND status IS DISTINCT FROM 'failed'
+              AND COALESCE(timestamp, NOW())::date = d
+        ) THEN
+            DELETE FROM sales_daily_buyers WHERE day = d AND player_id = o.player_id;
+        END IF;
+        IF NOT EXISTS (
+            SELECT 1 FROM orders
+            WHERE player_id = o.player_id AND item_id = o.item_id AND id <> o.id
+              AND status IS DISTINCT FROM 'failed' AND COALESCE(timestamp, NOW())::date = d
+        ) THEN
+            DELETE FROM sales_daily_item_buyers WHERE day = d AND item_id = o.item_id AND player_id = o.player_id;
+            IF FOUND THEN buyer_delta := 1; END IF;
+        END IF;
+
+        UPDATE sales_daily_item SET
+            orders = orders - 1,
+            quantity = quantity - o.quantity,
+            revenue = revenue - COALESCE(o.total_price, 0),
+            unique_buyers = unique_buyers - buyer_delta
+        WHERE day = d AND item_id = o.item_id;
+
+        UPDATE player_spend SET
+            orders = orders - 1,
+            spent = spent - COALESCE(o.total_price, 0)
+        WHERE player_id = o.player_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_order ON orders;
+CREATE TRIGGER trg_rollup_order AFTER INSERT OR UPDATE OF status OR DELETE ON orders
+FOR EACH ROW EXECUTE FUNCTION rollup_order();
+
+CREATE OR REPLACE FUNCTION rollup_taxi_order() RETURNS TRIGGER AS $$
+DECLARE
+    o RECORD;
+    adding BOOLEAN;
+    d DATE;
+    ride_price NUMERIC;
+    rider_delta INT := 0;
+BEGIN
+    -- Same rules as rollup_order(): failed rides don't count, deletes take a ride back out
+    IF TG_OP <> 'DELETE' AND NEW.status IS DISTINCT FROM 'failed'
+       AND (TG_OP = 'INSERT' OR OLD.status = 'failed') THEN
+        o := NEW;
+        adding := TRUE;
+    ELSIF TG_OP <> 'INSERT' AND OLD.status IS DISTINCT FROM 'failed'
+       AND (TG_OP = 'DELETE' OR NEW.status = 'failed') THEN
+        o := OLD;
+        adding := FALSE;
+    ELSE
+        RETURN NULL;
+    END IF;
+    d := COALESCE(o.created_at, NOW())::date;
+    -- Rides carry no price of their own; like the backfill, use the taxi's current price
+    SELECT COALESCE(MAX(t.price), 0) INTO ride_price FROM taxis t WHERE t.id = o.taxi_id;
+
+    IF adding THEN
+        INSERT INTO taxi_daily_riders VALUES (d, o.taxi_id, o.player_id) ON CONFLICT DO NOTHING;
+        IF FOUND THEN rider_delta := 1; END IF;
+
+        INSERT INTO taxi_daily (day, taxi_id, taxi_name, rides, revenue, unique_riders)
+        SELECT d, o.taxi_id, t.name, 1, ride_price, rider_delta
+        FROM (SELECT 1) AS one LEFT JOIN taxis t ON t.id = o.taxi_id
+        ON CONFLICT (day, taxi_id) DO UPDATE SET
+            taxi_name = COALESCE(EXCLUDED.taxi_name, taxi_daily.taxi_name),
+            rides = taxi_daily.rides + 1,
+            revenue = taxi_daily.revenue + EXCLUDED.revenue,
+            unique_riders = taxi_daily.unique_riders + EXCLUDED.unique_riders;
+
+        INSERT INTO player_spend (player_id, rides, spent)
+        VALUES (o.player_id, 1, ride_price)
+        ON CONFLICT (player_id) DO UPDATE SET
+            rides = player_spend.rides + 1,
+            spent = player_spend.spent + EXCLUDED.spent;
+    ELSE
+        IF NOT EXISTS (
+            SELECT 1 FROM taxi_orders
+            WHERE player_id = o.player_id AND taxi_id = o.taxi_id AND id <> o.id
+              AND status IS DISTINCT FROM 'failed' AND COALESCE(created_at, NOW())::date = d
+        ) THEN
+            DELETE FROM taxi_daily_riders WHERE day = d AND taxi_id = o.taxi_id AND player_id = o.player_id;
+            IF FOUND THEN rider_delta := 1; END IF;
+        END IF;
+
+        UPDATE taxi_daily SET
+            rides = rides - 1,
+            revenue = revenue - ride_price,
+            unique_riders = unique_riders - rider_delta
+        WHERE day = d AND taxi_id = o.taxi_id;
+
+        UPDATE player_spend SET
+            rides = rides - 1,
+            spent = spent - ride_price
+        WHERE player_id = o.player_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- taxi_orders is created by the bot on first start (db.init), which also installs this trigger
+DO $$
+BEGIN
+    IF to_regclass('taxi_orders') IS NOT NULL THEN
+        DROP TRIGGER IF EXISTS trg_rollup_taxi_order ON taxi_orders;
+        CREATE TRIGGER trg_rollup_taxi_order AFTER INSERT OR UPDATE OF status OR DELETE ON taxi_orders
+        FOR EACH ROW EXECUTE FUNCTION rollup_taxi_order();
+    END IF;
+END $$;
+
+-- Leaderboards: top-N snapshots per board, replaced periodically by the bot
+CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+    board TEXT NOT NULL,
+    rank INT NOT NULL,
+    player_id INT NOT NULL,
+    discord_id BIGINT,
+    name TEXT,
+    value NUMERIC NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (board, rank)
+);
+CREATE INDEX IF NOT EXISTS idx_players_balance ON players(balance DESC);
+
+DROP TRIGGER IF EXISTS trg_leaderboard_snapshots_version ON leaderboard_snapshots;
+CREATE TRIGGER trg_leaderboard_snapshots_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON leaderboard_snapshots
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
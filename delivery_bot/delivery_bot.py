@@ -8,12 +8,15 @@ import time
 import json
 import subprocess
 import psutil
-import psycopg2
-import psycopg2.extras
 import pyautogui
 import pyperclip
 import random
 from dotenv import load_dotenv
+import metrics
+from queries import (
+    fetch_pending_orders, mark_order_delivered, mark_order_failed,
+    fetch_pending_taxi_orders, fetch_queue_stats, mark_taxi_delivered, mark_taxi_failed,
+)
 
 # Optional: disable pyautogui fail-safe (corner of screen abort)
 # pyautogui.FAILSAFE = False
@@ -21,8 +24,7 @@ from dotenv import load_dotenv
 # Load environment variables from .env
 load_dotenv()
 
-# 🔐 Database
-DATABASE_URL = os.getenv("DATABASE_URL")
+# 🔐 Database: DATABASE_URL, read by queries.py
 
 # 🎮 Game paths & settings
 STEAM_PATH = os.getenv("STEAM_PATH")  # e.g. C:\\Steam\\steam.exe
@@ -36,59 +38,17 @@ STAGING_COORDS = os.getenv("STAGING_COORDS")  # e.g. "X=2922.660 Y=-58764.000 Z=
 SCREEN_WIDTH = int(os.getenv("SCREEN_WIDTH", "1280"))
 SCREEN_HEIGHT = int(os.getenv("SCREEN_HEIGHT", "720"))
 
-###############################################################################
-# Database functions
-###############################################################################
-
-def get_connection():
-    return psycopg2.connect(DATABASE_URL)
-
-def fetch_pending_orders():
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
-                SELECT o.id, p.scum_username, si.content
-                FROM orders o
-                JOIN players p ON o.player_id = p.id
-                JOIN shop_items si ON o.item_id = si.id
-                WHERE o.status IS NULL OR o.status = 'pending'
-                ORDER BY o.timestamp ASC
-                LIMIT 5
-            """)
-            return cur.fetchall()
-
-def mark_order_delivered(order_id):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE orders SET status = 'delivered' WHERE id = %s", (order_id,))
-            conn.commit()
-
-def fetch_pending_taxi_orders():
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
-                SELECT o.id,
-                       p.scum_username AS player_name,
-                       o.chosen_coordinate,
-                       t.coordinates
-                FROM taxi_orders o
-                JOIN players p ON o.player_id = p.id
-                JOIN taxis   t ON o.taxi_id = t.id
-                WHERE o.status = 'pending'
-                ORDER BY o.created_at ASC
-                LIMIT 5
-            """)
-            return cur.fetchall()
-
-def mark_taxi_delivered(order_id):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE taxi_orders SET status = 'delivered', completed_at = CURRENT_TIMESTAMP WHERE id = %s",
-                (order_id,)
-            )
-            conn.commit()
+# ⚖️ Scheduler settings (shop vs taxi queues)
+SHOP_QUEUE_WEIGHT = float(os.getenv("SHOP_QUEUE_WEIGHT", "1"))
+TAXI_QUEUE_WEIGHT = float(os.getenv("TAXI_QUEUE_WEIGHT", "1"))
+SCHEDULER_QUANTUM = float(os.getenv("SCHEDULER_QUANTUM", "4"))          # cost units credited per round per unit of weight
+QUEUE_AGE_BOOST_SECONDS = int(os.getenv("QUEUE_AGE_BOOST_SECONDS", "120"))  # orders older than this jump the line
+QUEUE_FETCH_LIMIT = int(os.getenv("QUEUE_FETCH_LIMIT", "10"))            # orders pulled per queue per poll
+CYCLE_COST_BUDGET = int(os.getenv("CYCLE_COST_BUDGET", "30"))            # cost units served before re-polling the DB
 
+# 📈 Metrics endpoint (Prometheus text format, local only by default; port 0 disables)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
 
 ###############################################################################
 # Game automation helpers
@@ -168,6 +128,8 @@ def send_command(command: str):
     """
     # Always prepend '#'
     full_command = f"#{command.lstrip('#')}"
+    verb = full_command[1:].split(" ", 1)[0].lower() or "unknown"
+    metrics.commands_issued.inc(command=verb)
     pyperclip.copy(full_command)
 
     # Paste and send
@@ -264,15 +226,21 @@ def deliver_order(order):
     print(f"📦 Delivering order {order['id']} to {username}...")
 
     # teleport to player
-    send_command(f"teleportto {username}")
-    time.sleep(5)
+    with metrics.step_duration.time(queue="shop", step="teleport"):
+        send_command(f"teleportto {username}")
+        time.sleep(5)
 
     # spawn items
-    for cmd in commands:
-        send_command(cmd)
+    with metrics.step_duration.time(queue="shop", step="spawn"):
+        for cmd in commands:
+            send_command(cmd)
 
     # mark as delivered
-    mark_order_delivered(order["id"])
+    with metrics.step_duration.time(queue="shop", step="mark"):
+        latency = mark_order_delivered(order["id"])
+    if latency is not None:
+        metrics.delivery_latency.observe(latency, queue="shop")
+    metrics.deliveries.inc(queue="shop", outcome="delivered")
     print(f"✅ Order {order['id']} delivered.")
 
 def deliver_taxi_order(order):
@@ -289,10 +257,9 @@ def deliver_taxi_order(order):
     if not coords_all:
         print(f"❌ Taxi order {order['id']} has no coordinates configured.")
         # Mark failed instead of delivered
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE taxi_orders SET status='failed', error='No coordinates' WHERE id=%s", (order["id"],))
-                conn.commit()
+        mark_taxi_failed(order["id"], "No coordinates")
+        metrics.step_failures.inc(queue="taxi", step="coordinates")
+        metrics.deliveries.inc(queue="taxi", outcome="failed")
         return
 
     chosen = _format_single_coord(order.get("chosen_coordinate")) or random.choice(coords_all)
@@ -300,23 +267,149 @@ def deliver_taxi_order(order):
     print(f"🚕 Taxi order {order['id']} → {username} to {chosen}")
 
     # 1) Drone to destination coord
-    send_command(f"teleport {chosen}")
-    time.sleep(3)
+    with metrics.step_duration.time(queue="taxi", step="teleport"):
+        send_command(f"teleport {chosen}")
+        time.sleep(3)
 
     # 2) Pull the player to taxi
-    send_command(f"teleporttome {username}")
-    time.sleep(5)
+    with metrics.step_duration.time(queue="taxi", step="pickup"):
+        send_command(f"teleporttome {username}")
+        time.sleep(5)
 
     # 3) Mark delivered
-    mark_taxi_delivered(order["id"])
+    with metrics.step_duration.time(queue="taxi", step="mark"):
+        latency = mark_taxi_delivered(order["id"])
+    if latency is not None:
+        metrics.delivery_latency.observe(latency, queue="taxi")
+    metrics.deliveries.inc(queue="taxi", outcome="delivered")
     print(f"✅ Taxi order {order['id']} delivered.")
 
 
+###############################################################################
+# Scheduler (weighted fair queueing across shop and taxi orders)
+###############################################################################
+
+def estimate_order_cost(kind, order):
+    """Cost in chat commands: shop = teleportto + one per spawn command, taxi = teleport + teleporttome."""
+    if kind == "taxi":
+        return 2
+    return 1 + len(generate_spawn_commands(order.get("content")))
+
+class DeliveryScheduler:
+    """
+    Deficit round robin over the shop and taxi queues.
+    Each round a queue is credited SCHEDULER_QUANTUM * weight cost units and may serve
+    orders while its head order fits in that credit. An order that has waited longer
+    than QUEUE_AGE_BOOST_SECONDS is served immediately regardless of credit, so the
+    worst-case wait stays bounded even with lopsided weights or expensive orders.
+    Deficits persist between polls so a queue never loses credit it already earned.
+    """
+
+    def __init__(self, weights, quantum=SCHEDULER_QUANTUM, age_boost_seconds=QUEUE_AGE_BOOST_SECONDS):
+        # A queue without positive credit would never be served and schedule() would spin
+        # until the age boost kicks in, so refuse such a configuration at startup
+        for kind, weight in weights.items():
+            if weight <= 0:
+                raise ValueError(f"{kind.upper()}_QUEUE_WEIGHT must be greater than 0 (got {weight})")
+        if quantum <= 0:
+            raise ValueError(f"SCHEDULER_QUANTUM must be greater than 0 (got {quantum})")
+        self.weights = weights
+        self.quantum = quantum
+        self.age_boost_seconds = age_boost_seconds
+        self.deficits = {kind: 0.0 for kind in weights}
+
+    def _age(self, entry):
+        order, fetched_at = entry["order"], entry["fetched_at"]
+        return float(order.get("age_seconds") or 0) + (time.monotonic() - fetched_at)
+
+    def _boosted(self, queues):
+        """Return the queue whose head order has waited the longest past the boost threshold, if any."""
+        oldest_kind, oldest_age = None, self.age_boost_seconds
+        for kind, queue in queues.items():
+            if queue:
+                age = self._age(queue[0])
+                if age >= oldest_age:
+                    oldest_kind, oldest_age = kind, age
+        return oldest_kind
+
+    def schedule(self, queues, budget=CYCLE_COST_BUDGET):
+        """
+        queues: {kind: [order, ...]} each sorted oldest first.
+        Yields (kind, order) pairs until the queues are empty or the cost budget is spent.
+        """
+        now = time.monotonic()
+        pending = {
+            kind: [{"order": o, "cost": estimate_order_cost(kind, o), "fetched_at": now} for o in orders]
+            for kind, orders in queues.items()
+        }
+        spent = 0
+
+        while spent < budget and any(pending.values()):
+            boosted = self._boosted(pending)
+            if boosted:
+                entry = pending[boosted].pop(0)
+                self.deficits[boosted] = max(0.0, self.deficits[boosted] - entry["cost"])
+                spent += entry["cost"]
+                yield boosted, entry["order"]
+                continue
+
+            for kind, queue in pending.items():
+                if not queue:
+                    # Idle queues don't bank credit (standard DRR reset)
+                    self.deficits[kind] = 0.0
+                    continue
+                self.deficits[kind] += self.quantum * self.weights.get(kind, 1)
+                while queue and queue[0]["cost"] <= self.deficits[kind] and spent < budget:
+                    entry = queue.pop(0)
+                    self.deficits[kind] -= entry["cost"]
+                    spent += entry["cost"]
+                    yield kind, entry["order"]
+
+scheduler = DeliveryScheduler({"shop": SHOP_QUEUE_WEIGHT, "taxi": TAXI_QUEUE_WEIGHT})
+
+def update_queue_stats(verbose=False):
+    try:
+        with metrics.step_duration.time(queue="all", step="stats"):
+            stats = fetch_queue_stats()
+    except Exception as e:
+        metrics.step_failures.inc(queue="all", step="stats")
+        print(f"⚠️ Could not read queue stats: {e}")
+        return {}
+    for kind, s in stats.items():
+        metrics.queue_depth.set(s["depth"], queue=kind)
+        metrics.queue_oldest_age.set(s["oldest_age"], queue=kind)
+        if verbose:
+            print(f"📊 {kind} queue: depth={s['depth']} oldest={int(s['oldest_age'])}s")
+    return stats
+
+def deliver_safely(kind, order):
+    """Deliver one order; a failure marks that order failed instead of stopping the bot."""
+    try:
+        if kind == "taxi":
+            deliver_taxi_order(order)
+        else:
+            deliver_order(order)
+    except Exception as e:
+        print(f"❌ {kind} order {order['id']} failed: {e}")
+        metrics.step_failures.inc(queue=kind, step="deliver")
+        metrics.deliveries.inc(queue=kind, outcome="failed")
+        try:
+            if kind == "taxi":
+                mark_taxi_failed(order["id"], str(e))
+            else:
+                mark_order_failed(order["id"])
+        except Exception as mark_error:
+            print(f"⚠️ Could not mark {kind} order {order['id']} failed: {mark_error}")
+
+
 ###############################################################################
 # Main Loop
 ###############################################################################
 
 def main_loop():
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+
     launch_scum_if_needed()
     focus_and_position_scum()
     skip_intro()
@@ -331,23 +424,22 @@ def main_loop():
     print("🚀 Delivery bot is active and checking for orders...")
 
     while True:
-        orders = fetch_pending_orders()
-        taxi_orders = fetch_pending_taxi_orders()
+        with metrics.step_duration.time(queue="all", step="fetch"):
+            orders = fetch_pending_orders(QUEUE_FETCH_LIMIT)
+            taxi_orders = fetch_pending_taxi_orders(QUEUE_FETCH_LIMIT)
 
-        if orders or taxi_orders:
-            # Shop item deliveries first
-            for order in orders:
-                deliver_order(order)
+        update_queue_stats(verbose=bool(orders or taxi_orders))
 
-            # Then taxi rides
-            for torder in taxi_orders:
-                deliver_taxi_order(torder)
+        if orders or taxi_orders:
+            # Interleave shop deliveries and taxi rides by weight/age
+            for kind, order in scheduler.schedule({"shop": orders, "taxi": taxi_orders}):
+                deliver_safely(kind, order)
 
-            # Return to staging after work
+            # Return to staging after work, then re-poll straight away
             teleport_to_staging()
-        else:
-            print("⏳ No pending orders. Waiting...")
+            continue
 
+        print("⏳ No pending orders. Waiting...")
         time.sleep(10)
 
 if __name__ == "__main__":
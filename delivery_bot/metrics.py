@@ -0,0 +1,160 @@
+###############################################################################
+### Delivery Bot Metrics ######################################################
+### Minimal Prometheus text-format exporter (stdlib only) #####################
+###############################################################################
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets sized for SCUM deliveries: a single command takes ~3s, a queue can back up for minutes
+LATENCY_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+STEP_BUCKETS = (0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    """Context manager observing wall time into a histogram; failures are counted by the caller."""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+        return False
+
+
+# ─── Metric definitions ──────────────────────────────────────
+
+queue_depth = Gauge("scum_delivery_queue_depth", "Pending orders per queue.")
+queue_oldest_age = Gauge("scum_delivery_queue_oldest_age_seconds", "Age of the oldest pending order per queue.")
+delivery_latency = Histogram(
+    "scum_delivery_latency_seconds", "Purchase-to-delivery latency per queue.", LATENCY_BUCKETS
+)
+deliveries = Counter("scum_deliveries_total", "Orders processed per queue and outcome.")
+commands_issued = Counter("scum_delivery_commands_total", "In-game chat commands issued, by command verb.")
+step_duration = Histogram("scum_delivery_step_seconds", "Wall time per delivery step.", STEP_BUCKETS)
+step_failures = Counter("scum_delivery_step_failures_total", "Failed delivery steps.")
+
+ALL_METRICS = (
+    queue_depth, queue_oldest_age, delivery_latency, deliveries,
+    commands_issued, step_duration, step_failures,
+)
+
+
+def render():
+    with _lock:
+        lines = []
+        for metric in ALL_METRICS:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ─── HTTP server ─────────────────────────────────────────────
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the console
+        pass
+
+
+def start_metrics_server(host, port):
+    """Serve /metrics on a daemon thread. Returns the server (or None if the port is unavailable)."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"⚠️ Metrics server not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,109 @@
+###############################################################################
+### Delivery Bot Queries ######################################################
+### Order & taxi queue SQL, free of game-automation imports so it also runs ###
+### from benchmarks (bench/db_bench.py) #######################################
+###############################################################################
+
+import os
+import psycopg2
+import psycopg2.extras
+
+DEFAULT_FETCH_LIMIT = 10
+
+def get_connection():
+    # Read at call time: delivery_bot.py loads .env after importing this module
+    return psycopg2.connect(os.getenv("DATABASE_URL"))
+
+def fetch_pending_orders(limit=DEFAULT_FETCH_LIMIT):
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                SELECT o.id, p.scum_username, si.content,
+                       EXTRACT(EPOCH FROM NOW() - o.timestamp) AS age_seconds
+                FROM orders o
+                JOIN players p ON o.player_id = p.id
+                JOIN shop_items si ON o.item_id = si.id
+                WHERE o.status IS NULL OR o.status = 'pending'
+                ORDER BY o.timestamp ASC
+                LIMIT %s
+            """, (limit,))
+            return cur.fetchall()
+
+def mark_order_delivered(order_id):
+    """Mark delivered and return purchase-to-delivery latency in seconds."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE orders
+                SET status = 'delivered', delivered_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING EXTRACT(EPOCH FROM delivered_at - timestamp)
+            """, (order_id,))
+            row = cur.fetchone()
+            conn.commit()
+            return float(row[0]) if row and row[0] is not None else None
+
+def mark_order_failed(order_id):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE orders SET status = 'failed' WHERE id = %s", (order_id,))
+            conn.commit()
+
+def fetch_pending_taxi_orders(limit=DEFAULT_FETCH_LIMIT):
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                SELECT o.id,
+                       p.scum_username AS player_name,
+                       o.chosen_coordinate,
+                       t.coordinates,
+                       EXTRACT(EPOCH FROM NOW() - o.created_at) AS age_seconds
+                FROM taxi_orders o
+                JOIN players p ON o.player_id = p.id
+                JOIN taxis   t ON o.taxi_id = t.id
+                WHERE o.status = 'pending'
+                ORDER BY o.created_at ASC
+                LIMIT %s
+            """, (limit,))
+            return cur.fetchall()
+
+def fetch_queue_stats():
+    """Return {queue: {"depth": n, "oldest_age": seconds}} for the shop and taxi queues."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT 'shop', COUNT(*), COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(timestamp)), 0)
+                FROM orders
+                WHERE status IS NULL OR status = 'pending'
+                UNION ALL
+                SELECT 'taxi', COUNT(*), COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)), 0)
+                FROM taxi_orders
+                WHERE status = 'pending'
+            """)
+            return {
+                row[0]: {"depth": row[1], "oldest_age": float(row[2])}
+                for row in cur.fetchall()
+            }
+
+def mark_taxi_delivered(order_id):
+    """Mark delivered and return order-to-pickup latency in seconds."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE taxi_orders
+                SET status = 'delivered', completed_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING EXTRACT(EPOCH FROM completed_at - created_at)
+            """, (order_id,))
+            row = cur.fetchone()
+            conn.commit()
+            return float(row[0]) if row and row[0] is not None else None
+
+def mark_taxi_failed(order_id, error):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE taxi_orders SET status = 'failed', error = %s, completed_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (error, order_id)
+            )
+            conn.commit()
@@ -4,44 +4,98 @@ import sys
 import os
 import json
 import io
-import requests
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../bot')))
 
-from flask import Flask, render_template, redirect, request, url_for, send_file, flash
+from flask import Flask, render_template, redirect, request, url_for, send_file, flash, session, make_response
 from psycopg2 import errors
 from bot import db
-from decimal import Decimal
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "fallback-secret-key")
-db.init()
+# Schema setup (db.init) runs once at startup: in __main__ below, or gunicorn's on_starting hook
 
 
 # ─────────────────────────────────────────────────────────────
-# 🔄 Function to POST a new item to Discord bot
+# 🗄 Version-stamped page caching
 # ─────────────────────────────────────────────────────────────
+# Triggers bump table_versions once per writing statement. A page's ETag is derived from
+# the versions of the tables it shows, so an unchanged page is a 304 for the browser and
+# a cache hit for the server (rendered HTML is kept per worker, keyed by URL + versions).
+
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "64"))
+_page_cache = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _templates_fingerprint():
+    # Changes on deploy, so browsers never keep HTML rendered by older templates.
+    # Walked on the first versioned page instead of at import, off the cold-start path.
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:12]
+
+
+def versioned_page(tables, render):
+    """Serve render() with ETag/Last-Modified driven by table versions; 304 or cached HTML when unchanged."""
+    if session.get('_flashes'):
+        # One-off flash messages are part of this render; never cache or revalidate it
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    versions = db.get_table_versions(tables)
+    stamp = ",".join(f"{table}:{versions[table][0]}" for table in tables)
+    etag = hashlib.sha1(f"{_templates_fingerprint()}|{request.full_path}|{stamp}".encode()).hexdigest()
+    modified = [updated for _, updated in versions.values() if updated is not None]
+    last_modified = max(modified) if modified else None
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        with _page_cache_lock:
+            html = _page_cache.get(etag)
+            if html is not None:
+                _page_cache.move_to_end(etag)
+        if html is None:
+            html = render()
+            with _page_cache_lock:
+                _page_cache[etag] = html
+                while len(_page_cache) > PAGE_CACHE_SIZE:
+                    _page_cache.popitem(last=False)
+        response = make_response(html)
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate, usually with a 304
+    return response
 
-def send_item_to_discord(item):
-    bot_api_url = os.getenv("BOT_API_URL", "http://discord-bot:3000/api/post_item")
 
+# ─────────────────────────────────────────────────────────────
+# ❤️ Health checks (container / load balancer probes)
+# ─────────────────────────────────────────────────────────────
+
+@app.route('/healthz')
+def healthz():
+    return {"status": "ok"}, 200
+
+
+@app.route('/readyz')
+def readyz():
     try:
-        print(f"📤 DEBUG: Sending to bot at {bot_api_url}")
-        
-        # Fix Decimal serialization
-        item_serializable = item.copy()
-        if isinstance(item_serializable.get("price"), Decimal):
-            item_serializable["price"] = int(item_serializable["price"])
-
-        print(f"📦 Payload: {json.dumps(item_serializable, indent=2)}")
-        
-        # ✅ Send the fixed version only
-        response = requests.post(bot_api_url, json=item_serializable, timeout=5)
-
-        print(f"✅ Response: {response.status_code} - {response.text}")
+        db.ping()
     except Exception as e:
-        print(f"❌ Exception posting to bot: {e}")
-
+        return {"status": "unavailable", "error": str(e)}, 503
+    return {"status": "ready"}, 200
 
 
 # ─────────────────────────────────────────────────────────────
@@ -57,10 +111,33 @@ def index():
 # 🛒 Shop Items
 # ─────────────────────────────────────────────────────────────
 
+ITEMS_PER_PAGE = 50
+
+
 @app.route('/items')
 def items():
-    shop_items = db.get_shop_items()
-    return render_template('items.html', items=shop_items)
+    query = request.args.get('q', '').strip()
+    category = request.args.get('category', '').strip()
+    if not query and not category:
+        return versioned_page(("shop_items",), lambda: render_template('items.html', items=db.get_shop_items()))
+
+    # 🔍 Ranked full-text + fuzzy search, paginated
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    def render():
+        results = db.search_shop_items(query, category or None, page=page, per_page=ITEMS_PER_PAGE)
+        pages = max((results["total"] + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, 1)
+        return render_template(
+            'items.html',
+            items=results["items"],
+            total=results["total"],
+            facets=results["facets"],
+            query=query,
+            category=category,
+            page=page,
+            pages=pages,
+        )
+    return versioned_page(("shop_items",), render)
 
 
 @app.route('/items/create', methods=['GET', 'POST'])
@@ -79,27 +156,14 @@ def create_item():
         content_raw = request.form.get('content', '')
         content = [line.strip() for line in content_raw.strip().splitlines() if line.strip()]
 
+        # ✅ The Discord post is queued in the bot outbox in the same transaction
         try:
             db.add_shop_item(name, category, price, image_url, description, content)
         except Exception as e:
             flash(f"❌ Failed to add item to DB: {e}", "error")
             return redirect(request.url)
 
-        # ✅ Fetch full item (including ID)
-        new_item = db.get_shop_item_by_name(name)
-        if not new_item:
-            flash("❌ Failed to retrieve item after insert", "error")
-            return redirect(url_for('items'))
-
-        # ✅ Send to Discord
-        try:
-            new_item["content"] = content
-            print(f"📣 About to send item to Discord: {new_item['name']}")
-            send_item_to_discord(new_item)
-            flash("✅ Item added and posted to Discord!", "success")
-        except Exception as e:
-            flash(f"⚠️ Item added to DB, but failed to post to Discord: {e}", "warning")
-
+        flash("✅ Item added — it will appear in Discord shortly.", "success")
         return redirect(url_for('items'))
 
     return render_template('create_item.html')
@@ -148,6 +212,47 @@ def force_delete_item(item_id):
     return redirect(url_for('items'))
 
 
+@app.route('/items/bulk', methods=['POST'])
+def bulk_items():
+    """Reprice, move or delete many items at once (one statement, one Discord refresh)."""
+    action = request.form.get('action')
+    item_ids = [int(i) for i in request.form.getlist('item_ids') if i.isdigit()]
+    category = request.form.get('scope_category', '').strip() if request.form.get('scope') == 'category' else None
+    if category is not None:
+        item_ids = None
+
+    try:
+        if action == 'reprice':
+            mode = request.form.get('mode', 'percent')
+            try:
+                value = float(request.form['value'])
+            except (KeyError, ValueError):
+                flash("❌ Invalid price value", "error")
+                return redirect(url_for('items'))
+            changed = db.bulk_reprice_items(mode, value, item_ids=item_ids, category=category)
+            flash(f"✅ Repriced {changed} item(s)", "success")
+        elif action == 'move':
+            new_category = request.form.get('new_category', '').strip()
+            if not new_category:
+                flash("❌ Enter the category to move items to", "error")
+                return redirect(url_for('items'))
+            changed = db.bulk_move_items(new_category, item_ids=item_ids, category=category)
+            flash(f"✅ Moved {changed} item(s) to {new_category}", "success")
+        elif action == 'delete':
+            deleted, kept = db.bulk_delete_items(
+                item_ids=item_ids, category=category, delete_orders=request.form.get('delete_orders') == 'on'
+            )
+            flash(f"✅ Deleted {deleted} item(s)", "success")
+            if kept:
+                flash(f"⚠️ Kept {kept} item(s) that have orders (tick 'also delete their orders' to remove them)", "warning")
+        else:
+            flash("❌ Unknown bulk action", "error")
+    except ValueError as e:
+        flash(f"❌ {e}", "error")
+
+    return redirect(request.referrer or url_for('items'))
+
+
 @app.route('/items/export')
 def export_items():
     items = db.export_shop_items()
@@ -181,8 +286,8 @@ def import_items():
 
 @app.route('/players')
 def players():
-    all_players = db.get_all_players()
-    return render_template('players.html', players=all_players)
+    # Not version-stamped: balances change with every purchase, so players has no change counter
+    return render_template('players.html', players=db.get_all_players())
 
 
 @app.route('/players/create', methods=['GET', 'POST'])
@@ -207,14 +312,8 @@ def edit_player(discord_id):
         new_username = request.form['scum_username']
         new_balance = request.form['balance']
 
-        with db.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE players
-                    SET scum_username = %s, balance = %s
-                    WHERE discord_id = %s
-                """, (new_username, new_balance, discord_id))
-                conn.commit()
+        # update_player also tells the bot processes to drop their cached copy
+        db.update_player(discord_id, new_username, new_balance)
 
         return redirect(url_for('players'))
 
@@ -269,11 +368,13 @@ from psycopg2.extras import RealDictCursor
 
 @app.route('/taxis')
 def taxis():
-    with db.get_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM taxis ORDER BY id;")
-            taxis = cur.fetchall()
-    return render_template('taxis.html', taxis=taxis)
+    def render():
+        with db.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT * FROM taxis ORDER BY id;")
+                taxis = cur.fetchall()
+        return render_template('taxis.html', taxis=taxis)
+    return versioned_page(("taxis",), render)
 
 @app.route('/taxis/create', methods=['GET', 'POST'])
 def taxis_create():
@@ -360,6 +461,35 @@ def taxis_delete(taxi_id):
     flash("Taxi deleted", "success")
     return redirect(url_for('taxis'))
 
+# ─────────────────────────────────────────────────────────────
+# 📊 Sales Analytics
+# ─────────────────────────────────────────────────────────────
+
+@app.route('/analytics')
+def analytics():
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    data = db.get_sales_analytics(days=days)
+    totals = {
+        "orders": sum(row["orders"] for row in data["daily"]),
+        "revenue": sum(row["revenue"] for row in data["daily"]),
+        "taxi_rides": sum(row["taxi_rides"] for row in data["daily"]),
+        "taxi_revenue": sum(row["taxi_revenue"] for row in data["daily"]),
+    }
+    return render_template('analytics.html', days=days, totals=totals, **data)
+
+
+# ─────────────────────────────────────────────────────────────
+# 🏆 Leaderboards (snapshots refreshed by the bot)
+# ─────────────────────────────────────────────────────────────
+
+@app.route('/leaderboard')
+def leaderboard():
+    return versioned_page(
+        ("leaderboard_snapshots",),
+        lambda: render_template('leaderboard.html', boards=db.get_leaderboards())
+    )
+
+
 def _print_routes_once():
     try:
         with app.app_context():
@@ -377,6 +507,8 @@ def _print_routes_once():
 # ─────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    # Development server; production uses gunicorn (see wsgi.py / gunicorn.conf.py)
+    db.init()
     _print_routes_once()
     app.run(host="0.0.0.0", port=5000, debug=True)
 
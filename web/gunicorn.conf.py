@@ -0,0 +1,33 @@
+# gunicorn.conf.py – multi-worker serving for the admin portal (used by Dockerfile.web)
+
+import os
+import multiprocessing
+
+# Blank values from .env / compose env_file count as unset
+bind = f"0.0.0.0:{os.getenv('WEB_PORT') or '5000'}"
+workers = int(os.getenv("WEB_WORKERS") or min(multiprocessing.cpu_count() * 2 + 1, 8))
+threads = int(os.getenv("WEB_THREADS") or 4)
+worker_class = "gthread"
+timeout = int(os.getenv("WEB_TIMEOUT") or 60)  # exports/imports of big catalogs can take a while
+graceful_timeout = 30
+preload_app = True  # import the app once in the master, workers fork from it
+accesslog = "-"
+errorlog = "-"
+
+# One pooled connection per worker thread; db.py reads this when it is imported by the app.
+# Threads that find every connection busy wait for one (DB_POOL_TIMEOUT) instead of failing.
+if not os.getenv("DB_POOL_MAX"):
+    os.environ["DB_POOL_MAX"] = str(threads)
+
+
+def on_starting(server):
+    # Schema DDL runs once per deployment start, not once per worker import
+    from bot import db
+    db.init()
+    db.reset_pool()  # don't leave master connections behind for the workers to inherit
+
+
+def post_fork(server, worker):
+    # Pools are per pid already; dropping the inherited table makes that explicit
+    from bot import db
+    db.reset_pool()
@@ -0,0 +1,10 @@
+# wsgi.py – production entry point for the admin portal
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Importing the app has no side effects beyond building routes; schema setup is done once
+# by gunicorn's on_starting hook and DB connections are pooled per worker (see gunicorn.conf.py).
+
+from app import app
+
+application = app